@@ -1,7 +1,9 @@
 import sqlite3
 
+from config import DATABASE_PATH
+
 def add_test_movie():
-    conn = sqlite3.connect('movies.db')
+    conn = sqlite3.connect(DATABASE_PATH)
     cursor = conn.cursor()
     
     # Добавляем тестовый фильм
@@ -9,8 +11,11 @@ def add_test_movie():
     test_file_id = "BAACAgIAAxkBAAIBOWgAAXUKvV7kAAE5AAH5AAH5AAH5AAH5AAH5"  # Нужно получить реальный!
     test_caption = "Тестовый фильм #123"
     
-    cursor.execute('INSERT OR REPLACE INTO movies VALUES (?, ?, ?)', 
-                  (test_code, test_file_id, test_caption))
+    cursor.execute(
+        'INSERT INTO movies (code, file_id, caption) VALUES (?, ?, ?) '
+        'ON CONFLICT(code) DO UPDATE SET file_id = excluded.file_id, caption = excluded.caption',
+        (test_code, test_file_id, test_caption)
+    )
     conn.commit()
     conn.close()
     
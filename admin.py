@@ -2,14 +2,16 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext, CallbackQueryHandler
 from config import ADMIN_IDS
 from database import Database
+from archive_scanner import ArchiveScanner, format_report
 import logging
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class AdminPanel:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, scanner: ArchiveScanner = None):
         self.db = db
+        self.scanner = scanner
 
     def admin_menu(self, update: Update, context: CallbackContext):
         if update.effective_user.id not in ADMIN_IDS:
@@ -55,10 +57,10 @@ class AdminPanel:
 🎬 Фильмов в базе: {movies_count}
 👥 Пользователей: {users_count}
 
-🔥 Последние добавленные коды:
+🔥 Популярные коды:
 """
-        for code in popular_codes:
-            stats_text += f"• {code[0]}\n"
+        for code, count in popular_codes:
+            stats_text += f"• {code} — {count}\n"
         
         keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -88,10 +90,28 @@ class AdminPanel:
         query.edit_message_text("📌 Управление каналами:", reply_markup=reply_markup)
 
     def refresh_database(self, query, context):
-        query.edit_message_text("🔄 Сканирую архив-канал...")
-        # Здесь будет логика сканирования канала
-        # Пока заглушка
-        query.edit_message_text("✅ База фильмов обновлена!")
+        if self.scanner is None:
+            query.edit_message_text("❌ Сканер архива не настроен")
+            return
+        # Сканирование долгое, поэтому идёт в фоне и само обновляет сообщение
+        context.application.create_task(self._scan_archive(query, context))
+
+    async def _scan_archive(self, query, context):
+        if self.scanner.running:
+            await query.edit_message_text("⏳ Сканирование архива уже идёт")
+            return
+
+        async def progress(report):
+            await query.edit_message_text(format_report(report))
+
+        await query.edit_message_text("🔄 Сканирую архив-канал...")
+        try:
+            report = await self.scanner.scan(context.bot, query.message.chat_id, on_progress=progress)
+        except Exception as e:
+            logger.error(f"Ошибка сканирования архива: {e}")
+            await query.edit_message_text(f"❌ Ошибка сканирования: {e}")
+            return
+        await query.edit_message_text(format_report(report, finished=True))
 
     def handle_admin_back(self, query):
         keyboard = [
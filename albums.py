@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AlbumCollector:
+    """Собирает сообщения одного альбома (media_group_id).
+
+    Telegram присылает альбом отдельными апдейтами подряд, без признака
+    последнего элемента. Альбом считается полным, когда window секунд
+    не приходило новых элементов; тогда on_album получает все его
+    сообщения в порядке message_id.
+    """
+
+    def __init__(self, on_album: Callable[..., Awaitable], window: float = 2.0):
+        self.on_album = on_album
+        self.window = window
+        self._albums: Dict[Tuple[int, str], List] = {}
+        self._timers: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    def add(self, bot, message):
+        key = (message.chat_id, message.media_group_id)
+        self._albums.setdefault(key, []).append(message)
+        timer = self._timers.get(key)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.create_task(self._complete_later(bot, key))
+
+    async def _complete_later(self, bot, key):
+        await asyncio.sleep(self.window)
+        # После этой точки таймер не отменяется: опоздавший элемент начнёт новый альбом
+        del self._timers[key]
+        messages = sorted(self._albums.pop(key), key=lambda message: message.message_id)
+        try:
+            await self.on_album(bot, messages)
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома {key[1]}: {e}", exc_info=True)
+
+    @property
+    def pending(self) -> int:
+        return len(self._albums)
+
+    async def stop(self):
+        """Отменяет ожидание незавершённых альбомов (их нужно будет прислать заново)"""
+        for timer in self._timers.values():
+            timer.cancel()
+        if self._albums:
+            logger.warning(f"Не обработано альбомов при остановке: {len(self._albums)}")
+        self._timers.clear()
+        self._albums.clear()
@@ -0,0 +1,188 @@
+"""Импорт фильмов из архив-канала в таблицу movies.
+
+Bot API не умеет читать историю канала, поэтому сканер по очереди
+пересылает сообщения архива по message_id во вспомогательный чат,
+разбирает пересланную копию по тем же правилам, что handle_admin_video,
+и сразу удаляет её. Позиция сохраняется вместе с каждой пачкой фильмов,
+так что следующий запуск продолжает с последнего найденного сообщения.
+
+Проверка на фейковом Bot API с записанной историей канала:
+
+    python fake_bot_api.py --port 8081 --history archive.json
+    python archive_scanner.py --base-url http://127.0.0.1:8081/bot --token 123456:fake --chat 1
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+from telegram.error import BadRequest, TelegramError, TimedOut
+
+from codes import extract_code, extract_file_id, extract_file_unique_id
+from outbound import PRIORITY_BACKGROUND, OutboundScheduler, priority_kwargs
+from ratelimit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Ответы forwardMessage, которые означают пропуск в нумерации сообщений канала
+MISSING_MESSAGE_ERRORS = ('message to forward not found', 'message_id_invalid')
+
+
+class ArchiveScanner:
+    """Инкрементальный сканер архив-канала с пакетной записью в базу"""
+
+    def __init__(self, db, channel_id: int, batch_size: int = 100, max_gap: int = 50, rate: float = 20):
+        self.db = db
+        self.channel_id = channel_id
+        self.batch_size = batch_size
+        # Столько несуществующих message_id подряд считаем концом канала
+        self.max_gap = max_gap
+        # rate — запросов в секунду на пересылки и удаления вместе
+        self.limiter = AsyncTokenBucket(rate)
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def _forward(self, bot, scratch_chat_id: int, message_id: int):
+        """Пересылает сообщение архива; None, если такого сообщения нет.
+
+        RetryAfter и сетевые ошибки повторяет OutboundScheduler; если он сдался,
+        ошибка прерывает скан и доходит до сообщения с прогрессом.
+        """
+        await self.limiter.acquire()
+        try:
+            return await bot.forward_message(
+                chat_id=scratch_chat_id, from_chat_id=self.channel_id,
+                message_id=message_id, disable_notification=True,
+                **priority_kwargs(bot, PRIORITY_BACKGROUND)
+            )
+        except BadRequest as e:
+            # Сообщение удалено или ещё не существует. Остальные ошибки (нет служебного чата,
+            # нет прав) повторятся на каждом сообщении, и скан закончился бы пустым «успехом»
+            if any(reason in e.message.lower() for reason in MISSING_MESSAGE_ERRORS):
+                return None
+            raise
+        except TimedOut:
+            # Пересылка могла дойти, но её message_id неизвестен — удалить копию не получится
+            logger.warning(f"Таймаут пересылки сообщения {message_id}: в чате {scratch_chat_id} могла остаться копия")
+            raise
+
+    async def scan(self, bot, scratch_chat_id: int, on_progress: Optional[Callable] = None,
+                   progress_interval: float = 5) -> dict:
+        """Сканирует канал с последней сохранённой позиции и возвращает отчёт.
+
+        scratch_chat_id — чат, куда временно пересылаются сообщения архива.
+        """
+        async with self._lock:
+            # Пересылки в служебный чат идут со скоростью сканера, а не с лимитом обычного чата
+            scheduler = getattr(bot, 'rate_limiter', None)
+            if hasattr(scheduler, 'set_chat_rate'):
+                scheduler.set_chat_rate(scratch_chat_id, self.limiter.rate)
+            try:
+                return await self._scan(bot, scratch_chat_id, on_progress, progress_interval)
+            finally:
+                if hasattr(scheduler, 'reset_chat_rate'):
+                    scheduler.reset_chat_rate(scratch_chat_id)
+
+    async def _scan(self, bot, scratch_chat_id: int, on_progress: Optional[Callable], progress_interval: float) -> dict:
+        position = await self.db.get_archive_scan_position(self.channel_id)
+        report = {
+            'start_message_id': position, 'last_message_id': position,
+            'scanned': 0, 'imported': 0, 'new': 0, 'skipped': 0, 'elapsed': 0.0, 'rate': 0.0,
+        }
+        started_at = last_progress = time.monotonic()
+        batch = []
+        message_id, misses = position, 0
+
+        async def flush():
+            report['new'] += await self.db.save_archive_batch(self.channel_id, report['last_message_id'], batch)
+            report['imported'] += len(batch)
+            batch.clear()
+
+        while misses < self.max_gap:
+            message_id += 1
+            forwarded = await self._forward(bot, scratch_chat_id, message_id)
+            if forwarded is None:
+                misses += 1
+                continue
+            misses = 0
+            report['scanned'] += 1
+            report['last_message_id'] = message_id
+            try:
+                await self.limiter.acquire()
+                await bot.delete_message(scratch_chat_id, forwarded.message_id)
+            except TelegramError as e:
+                logger.warning(f"Не удалось удалить пересланное сообщение {forwarded.message_id}: {e}")
+
+            code = extract_code(forwarded.caption)
+            file_id = extract_file_id(forwarded)
+            if code and file_id:
+                batch.append((code, file_id, forwarded.caption, extract_file_unique_id(forwarded)))
+            else:
+                report['skipped'] += 1
+            if len(batch) >= self.batch_size:
+                await flush()
+
+            if on_progress is not None and time.monotonic() - last_progress >= progress_interval:
+                last_progress = time.monotonic()
+                self._update_rate(report, started_at)
+                await on_progress(report)
+
+        await flush()
+        self._update_rate(report, started_at)
+        logger.info(
+            f"🔄 Архив просканирован: сообщений {report['scanned']}, фильмов {report['imported']} "
+            f"(новых {report['new']}), до сообщения {report['last_message_id']}"
+        )
+        return report
+
+    @staticmethod
+    def _update_rate(report: dict, started_at: float):
+        report['elapsed'] = time.monotonic() - started_at
+        report['rate'] = report['scanned'] / report['elapsed'] if report['elapsed'] > 0 else 0.0
+
+
+def format_report(report: dict, finished: bool = False) -> str:
+    header = "✅ База фильмов обновлена!" if finished else "🔄 Сканирую архив-канал..."
+    return (
+        f"{header}\n\n"
+        f"📨 Сообщений: {report['scanned']} (до #{report['last_message_id']})\n"
+        f"🎬 Фильмов: {report['imported']}, новых: {report['new']}\n"
+        f"⏭ Без кода или видео: {report['skipped']}\n"
+        f"⚡️ {report['rate']:.1f} сообщ./сек за {report['elapsed']:.0f} сек"
+    )
+
+
+async def main(args):
+    from telegram.ext import ExtBot
+    from bot import db
+    from config import ARCHIVE_CHANNEL_ID, OUTBOUND_GLOBAL_RATE, OUTBOUND_MAX_RETRIES
+
+    # Тот же планировщик, что у бота: он повторяет RetryAfter и сетевые ошибки
+    scheduler = OutboundScheduler(global_rate=OUTBOUND_GLOBAL_RATE, max_retries=OUTBOUND_MAX_RETRIES)
+    bot = ExtBot(args.token, base_url=args.base_url, rate_limiter=scheduler)
+    scanner = ArchiveScanner(db, args.channel or ARCHIVE_CHANNEL_ID, max_gap=args.max_gap)
+
+    async def progress(report):
+        print(format_report(report))
+
+    try:
+        async with bot:
+            report = await scanner.scan(bot, args.chat, on_progress=progress)
+        print(format_report(report, finished=True))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт фильмов из архив-канала")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--base-url", default="https://api.telegram.org/bot")
+    parser.add_argument("--chat", type=int, required=True, help="чат, куда временно пересылаются сообщения")
+    parser.add_argument("--channel", type=int, help="архив-канал (по умолчанию ARCHIVE_CHANNEL_ID)")
+    parser.add_argument("--max-gap", type=int, default=50)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,239 @@
+"""Нагрузочный замер бота на фейковом Bot API.
+
+Запускает настоящее Application со всеми обработчиками (build_application)
+против FakeBotAPI и подаёт в очередь апдейтов синтетическую нагрузку:
+правильные и несуществующие коды, /start, нажатия «✅ Tekshirish» и
+запросы пользователей без подписки. Отчёт: апдейтов в секунду, задержка
+обработчиков p50/p95/p99 по видам апдейтов и число вызовов Bot API на апдейт.
+Отдельно можно замерить рассылку (/broadcast) на --broadcast-users получателей.
+
+Фейковый Bot API работает в отдельном потоке со своим event loop, а лимиты
+исходящих сообщений бота (общий и на чат) по умолчанию сняты, так что
+замер показывает работу самих обработчиков. Чтобы увидеть влияние лимитов,
+задайте --outbound-rate и --chat-rate.
+
+    python benchmark.py --updates 5000 --latency 0.05
+    python benchmark.py --updates 2000 --flood-rate 30 --outbound-rate 30 --chat-rate 1
+    python benchmark.py --updates 0 --broadcast-users 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from telegram import Update
+
+from fake_bot_api import FakeBotAPI, FakeBotAPIThread
+
+KINDS = ('valid', 'invalid', 'unsubscribed', 'start', 'callback')
+USER_ID_BASE = 1_000_000
+
+
+def user_dict(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}", 'username': f"user{user_id}"}
+
+
+def message_update(update_id: int, user_id: int, text: str, **extra) -> dict:
+    message = {
+        'message_id': update_id, 'date': int(time.time()), 'text': text,
+        'chat': {'id': user_id, 'type': 'private'}, 'from': user_dict(user_id),
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    message.update(extra)
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id: int, user_id: int, bot_message: dict) -> dict:
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'chat_instance': str(user_id), 'data': 'check_subscription',
+            'from': user_dict(user_id), 'message': bot_message,
+        },
+    }
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in KINDS:
+            raise argparse.ArgumentTypeError(f"неизвестный вид апдейта: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+class Benchmark:
+    def __init__(self, bot_module, api: FakeBotAPI, application, args):
+        self.bot = bot_module
+        self.api = api
+        self.application = application
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.kinds = {}
+        self.handler_latency = defaultdict(list)
+        self.total_latency = []
+        self.enqueued_at = {}
+        self.remaining = 0
+        self.done = asyncio.Event()
+
+        # Время работы обработчиков меряем внутри процессора апдейтов, без ожидания в очереди
+        processor = bot_module.update_processor
+        original = processor.do_process_update
+
+        async def timed(update, coroutine):
+            started_at = time.perf_counter()
+            try:
+                await original(update, coroutine)
+            finally:
+                finished_at = time.perf_counter()
+                kind = self.kinds.pop(update.update_id, None)
+                if kind is not None:
+                    self.handler_latency[kind].append(finished_at - started_at)
+                    self.total_latency.append(finished_at - self.enqueued_at.pop(update.update_id))
+                    self.remaining -= 1
+                    if self.remaining == 0:
+                        self.done.set()
+
+        processor.do_process_update = timed
+
+    def make_update(self, update_id: int, kind: str) -> dict:
+        user_id = USER_ID_BASE + self.random.randrange(self.args.users)
+        if kind == 'unsubscribed':
+            user_id = USER_ID_BASE + self.args.users + self.random.randrange(self.args.users)
+            self.api.non_members.add(user_id)
+            return message_update(update_id, user_id, str(self.random.randint(1, self.args.movies)))
+        if kind == 'valid':
+            return message_update(update_id, user_id, str(self.random.randint(1, self.args.movies)))
+        if kind == 'invalid':
+            return message_update(update_id, user_id, str(self.args.movies + self.random.randint(1, 10 ** 6)))
+        if kind == 'start':
+            return message_update(update_id, user_id, '/start')
+        # Нажатие кнопки под сообщением бота о подписке
+        bot_message = self.api._store(user_id, {'text': "📢 Botdan foydalanish uchun...",
+                                                'from': {'id': self.api.bot_id, 'is_bot': True,
+                                                         'first_name': 'FakeBot'}})
+        return callback_update(update_id, user_id, bot_message)
+
+    async def run_load(self):
+        mix = self.args.mix
+        kinds = self.random.choices(list(mix), weights=list(mix.values()), k=self.args.updates)
+        # Апдейты готовим заранее: их генерация не должна попадать в замер
+        updates = [Update.de_json(self.make_update(update_id, kind), self.application.bot)
+                   for update_id, kind in enumerate(kinds, 1)]
+        self.remaining = len(kinds)
+        calls_before = sum(self.api.calls.values())
+        started_at = time.perf_counter()
+        interval = 1 / self.args.rate if self.args.rate else 0
+        for update_id, (kind, update) in enumerate(zip(kinds, updates), 1):
+            self.kinds[update_id] = kind
+            self.enqueued_at[update_id] = time.perf_counter()
+            await self.application.update_queue.put(update)
+            if interval:
+                await asyncio.sleep(max(0.0, started_at + update_id * interval - time.perf_counter()))
+        await asyncio.wait_for(self.done.wait(), self.args.timeout)
+        elapsed = time.perf_counter() - started_at
+        calls = sum(self.api.calls.values()) - calls_before
+
+        print(f"📨 Апдейтов: {len(kinds)} за {elapsed:.2f} сек — {len(kinds) / elapsed:.0f}/сек")
+        ms = [latency * 1000 for latency in self.total_latency]
+        print(f"⏱ От очереди до конца обработки, мс: p50 {percentile(ms, 0.5):.1f}, "
+              f"p95 {percentile(ms, 0.95):.1f}, p99 {percentile(ms, 0.99):.1f}")
+        for kind in KINDS:
+            ms = [latency * 1000 for latency in self.handler_latency.get(kind, ())]
+            if ms:
+                print(f"   {kind:<13} {len(ms):>6} шт.  p50 {percentile(ms, 0.5):7.1f}  "
+                      f"p95 {percentile(ms, 0.95):7.1f}  p99 {percentile(ms, 0.99):7.1f}")
+        print(f"📡 Вызовов Bot API на апдейт: {calls / len(kinds):.2f}")
+
+    async def run_broadcast(self):
+        users = self.args.broadcast_users
+        await self.bot.db.pool.executemany(
+            'INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)',
+            [(USER_ID_BASE + 10 ** 6 + i, None) for i in range(users)]
+        )
+        admin_id = self.bot.ADMIN_IDS[0]
+        source = self.api._store(admin_id, {'text': "📢 Benchmark"})
+        source['from'] = user_dict(admin_id)
+        copies_before = self.api.calls['copyMessage']
+        update = message_update(10 ** 9, admin_id, '/broadcast', reply_to_message=source)
+        started_at = time.perf_counter()
+        await self.application.update_queue.put(Update.de_json(update, self.application.bot))
+        while not self.bot.broadcaster.active:
+            await asyncio.sleep(0.01)
+        while self.bot.broadcaster.active:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started_at
+        copies = self.api.calls['copyMessage'] - copies_before
+        print(f"📢 Рассылка: {copies} copyMessage на {users} получателей за {elapsed:.2f} сек — "
+              f"{copies / elapsed:.0f} сообщ./сек")
+
+
+async def main(args):
+    import bot
+
+    api = FakeBotAPI(latency=args.latency, flood_rate=args.flood_rate)
+    server = FakeBotAPIThread(api)
+    server.start()
+    await bot.db.add_movies([(str(code), f"file_{code}", f"#{code} benchmark") for code in range(1, args.movies + 1)])
+
+    application = bot.build_application(api.token, api.base_url)
+    benchmark = Benchmark(bot, api, application, args)
+    limits = lambda rate: "без ограничения" if rate >= 100000 else f"{rate:g}/сек"
+    print(f"🔬 Замер: обработчики бота против фейкового Bot API в отдельном потоке "
+          f"(задержка ответа {args.latency * 1000:.0f} мс); лимиты исходящих: общий {limits(args.outbound_rate)}, "
+          f"на чат {limits(args.chat_rate)}")
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    try:
+        if args.updates:
+            await benchmark.run_load()
+        if args.broadcast_users:
+            await benchmark.run_broadcast()
+    finally:
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        server.stop()
+
+    print(f"🚦 Ответов 429 от Bot API: {api.flood_errors}, по методам: {dict(api.calls)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный замер бота на фейковом Bot API")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=0, help="апдейтов в секунду; 0 — все сразу")
+    parser.add_argument("--users", type=int, default=500, help="число разных пользователей")
+    parser.add_argument("--movies", type=int, default=1000)
+    parser.add_argument("--mix", type=parse_mix, default="valid=70,invalid=15,unsubscribed=5,start=5,callback=5",
+                        help="доли видов апдейтов: " + ",".join(f"{kind}=N" for kind in KINDS))
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API (сек)")
+    parser.add_argument("--flood-rate", type=float, help="лимит Bot API на отправку сообщений в секунду")
+    parser.add_argument("--outbound-rate", type=float, default=100000,
+                        help="OUTBOUND_GLOBAL_RATE бота; по умолчанию без ограничения")
+    parser.add_argument("--chat-rate", type=float, default=100000,
+                        help="OUTBOUND_CHAT_RATE бота (сообщений в секунду в один чат); по умолчанию без ограничения")
+    parser.add_argument("--broadcast-users", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "benchmark.db"))
+    os.environ["OUTBOUND_GLOBAL_RATE"] = str(args.outbound_rate)
+    os.environ["OUTBOUND_CHAT_RATE"] = str(args.chat_rate)
+    os.environ["OUTBOUND_CHAT_BURST"] = str(max(3.0, args.chat_rate))
+    # Синтетические пользователи пишут чаще живых; защиту от флуда можно включить через FLOOD_USER_RATE
+    os.environ.setdefault("FLOOD_USER_RATE", "100000")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
@@ -0,0 +1,72 @@
+import hashlib
+import math
+from typing import Iterable
+
+
+class CountingBloomFilter:
+    """Компактный фильтр «кода точно нет» с поддержкой удаления.
+
+    Вместо битов используются 8-битные счётчики, поэтому remove() работает
+    без перестройки. Ложноотрицательных ответов не бывает: если
+    might_contain() вернул False, кода в каталоге нет.
+    """
+
+    def __init__(self, capacity: int = 100_000, fp_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.fp_rate = fp_rate
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self._counters = bytearray(self.size)
+        self.count = 0
+
+    @classmethod
+    def build(cls, codes: Iterable[str], capacity: int, fp_rate: float) -> 'CountingBloomFilter':
+        bloom = cls(capacity, fp_rate)
+        for code in codes:
+            bloom.add(code)
+        return bloom
+
+    def _positions(self, code: str):
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, code: str):
+        for pos in self._positions(code):
+            # Насыщенный счётчик больше не трогаем ни при add, ни при remove
+            if self._counters[pos] < 255:
+                self._counters[pos] += 1
+        self.count += 1
+
+    def remove(self, code: str):
+        positions = self._positions(code)
+        if not all(self._counters[pos] for pos in positions):
+            return
+        for pos in positions:
+            if self._counters[pos] < 255:
+                self._counters[pos] -= 1
+        self.count -= 1
+
+    def might_contain(self, code: str) -> bool:
+        return all(self._counters[pos] for pos in self._positions(code))
+
+    def __contains__(self, code: str) -> bool:
+        return self.might_contain(code)
+
+    def memory_usage(self) -> int:
+        return len(self._counters)
+
+    def estimated_fp_rate(self) -> float:
+        """Ожидаемая доля ложных срабатываний при текущем заполнении"""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    def stats(self) -> dict:
+        return {
+            'count': self.count,
+            'capacity': self.capacity,
+            'hash_count': self.hash_count,
+            'memory_bytes': self.memory_usage(),
+            'target_fp_rate': self.fp_rate,
+            'estimated_fp_rate': self.estimated_fp_rate(),
+        }
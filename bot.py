@@ -1,10 +1,45 @@
+import hashlib
 import logging
-import sqlite3
-import re
+import secrets
+from collections import OrderedDict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, CallbackQueryHandler
+from telegram import InlineQueryResultCachedVideo, InlineQueryResultsButton, InputMediaVideo, InputMediaDocument
+from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, CallbackQueryHandler, ChatMemberHandler
+from telegram.ext import InlineQueryHandler, TypeHandler, ApplicationHandlerStop
 from telegram.ext import filters
+from sqlite_pool import SQLitePool
+from catalog import MovieCatalog
+from bloom import CountingBloomFilter
+from suggest import CodeSuggester
+from search import SearchCache, build_match_query
+from write_behind import UserWriteBehind
+from broadcast import Broadcaster
+from stats import StatsCounters
+from codes import is_valid_code, extract_code, extract_file_id, extract_file_unique_id
+from codes import extract_code_range, strip_code_range
+from albums import AlbumCollector
+from floodguard import FloodGuard
+from archive_scanner import ArchiveScanner, format_report
+from subscription import MembershipCache, MembershipStore, SubscriptionChecker
+from update_processor import PerUserUpdateProcessor
+from outbound import OutboundScheduler, PRIORITY_NAMES
+from metrics import REGISTRY, DB_SECONDS, HANDLER_SECONDS, API_REQUESTS, THROTTLED_UPDATES, MetricsServer
+from metrics import instrument_handlers, timed_methods, summarize
 from config import BOT_TOKEN, ADMIN_IDS, ARCHIVE_CHANNEL_ID, REQUIRED_CHANNELS, CODES_CHANNEL
+from config import DATABASE_PATH, DB_READ_POOL_SIZE, MOVIE_CATALOG_MAX_ENTRIES
+from config import MOVIE_FILTER_CAPACITY, MOVIE_FILTER_FP_RATE
+from config import USER_FLUSH_INTERVAL, USER_FLUSH_MAX_PENDING, STATS_FLUSH_INTERVAL
+from config import BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_CHUNK_SIZE, BROADCAST_PROGRESS_INTERVAL
+from config import MOVIES_PAGE_SIZE, SUGGEST_MAX_DISTANCE, SUGGEST_LIMIT
+from config import INLINE_PAGE_SIZE, INLINE_CACHE_TIME, SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE
+from config import ALBUM_COLLECT_WINDOW
+from config import FLOOD_USER_RATE, FLOOD_USER_BURST, FLOOD_GLOBAL_RATE, FLOOD_MAX_USERS
+from config import ARCHIVE_SCAN_CHAT_ID, ARCHIVE_SCAN_BATCH_SIZE, ARCHIVE_SCAN_MAX_GAP
+from config import SUBSCRIPTION_CACHE_TTL, SUBSCRIPTION_NEGATIVE_TTL, SUBSCRIPTION_CHECK_CONCURRENCY
+from config import MEMBERSHIP_RECONCILE_ON_START, MEMBERSHIP_RECONCILE_RATE
+from config import UPDATE_CONCURRENCY, METRICS_HOST, METRICS_PORT
+from config import OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES
+from config import WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
 from config import BOT_TOKEN
 
 # Настройка логирования
@@ -15,13 +50,36 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # База данных
+@timed_methods(DB_SECONDS)
 class Database:
-    def __init__(self, db_path="movies.db"):
+    def __init__(self, db_path=DATABASE_PATH, readers=DB_READ_POOL_SIZE, catalog_max_entries=MOVIE_CATALOG_MAX_ENTRIES):
         self.db_path = db_path
+        self.pool = SQLitePool(db_path, readers=readers)
+        self.catalog = MovieCatalog(max_entries=catalog_max_entries)
+        self.suggester = CodeSuggester(max_distance=SUGGEST_MAX_DISTANCE)
+        self.search_cache = SearchCache(ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE)
+        self.filter_rejections = 0
+        # Каналы обязательной подписки нужны на каждое сообщение, а меняются редко
+        self._channels = None
+        self._channels_version = 0
+        self.user_writes = UserWriteBehind(self.pool, flush_interval=USER_FLUSH_INTERVAL, max_pending=USER_FLUSH_MAX_PENDING)
+        self.stats = StatsCounters(self.pool, flush_interval=STATS_FLUSH_INTERVAL)
         self.init_db()
     
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
+        self.pool.write_sync(self._create_schema)
+        # Фильтр строим синхронно до старта, чтобы ни один add_movie не прошёл мимо него
+        self.movie_filter = self.pool.write_sync(self._build_movie_filter)
+        print("✅ База данных инициализирована")
+    
+    def _build_movie_filter(self, conn):
+        count = conn.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+        # Запас по ёмкости, чтобы доля ложных срабатываний не росла по мере добавления фильмов
+        capacity = max(MOVIE_FILTER_CAPACITY, count * 2)
+        codes = (row[0] for row in conn.execute('SELECT code FROM movies'))
+        return CountingBloomFilter.build(codes, capacity, MOVIE_FILTER_FP_RATE)
+    
+    def _create_schema(self, conn):
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -50,6 +108,125 @@ class Database:
             )
         ''')
         
+        # Подписчики каналов по апдейтам chat_member
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_members (
+                channel_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                is_member INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (channel_id, user_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Рассылки и их контрольные точки
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_chat_id INTEGER NOT NULL,
+                from_chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                progress_message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'running',
+                total INTEGER NOT NULL DEFAULT 0,
+                last_user_id INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # До какого сообщения просканирован архив-канал
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive_scan_state (
+                channel_id INTEGER PRIMARY KEY,
+                last_message_id INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Колонки, которых нет в базах от старых версий бота
+        self._add_column(cursor, 'users', 'unreachable_reason', 'TEXT')
+        self._add_column(cursor, 'users', 'unreachable_at', 'DATETIME')
+        self._add_column(cursor, 'broadcasts', 'segment_days', 'INTEGER')
+        self._add_column(cursor, 'broadcasts', 'unreachable', 'INTEGER NOT NULL DEFAULT 0')
+        
+        self._add_column(cursor, 'movies', 'request_count', 'INTEGER NOT NULL DEFAULT 0')
+        self._add_column(cursor, 'movies', 'file_unique_id', 'TEXT')
+        
+        # Повторная загрузка того же файла находится по file_unique_id до отправки в архив.
+        # Индекс не уникальный: несколько кодов могут ссылаться на один файл (псевдонимы)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_file_unique_id ON movies (file_unique_id)')
+        
+        # Топ популярных кодов читается по индексу, без сортировки всей таблицы
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_request_count ON movies (request_count)')
+        
+        # Дневные счётчики запросов по кодам для топа за день и неделю
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS movie_requests (
+                day TEXT NOT NULL,
+                code TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, code)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Для рассылок по сегментам активности
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users (last_activity)')
+        
+        # Счётчики для статистики: число фильмов и пользователей ведут триггеры
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        for table in ('movies', 'users'):
+            cursor.execute(
+                f'INSERT OR IGNORE INTO stats (name, value) SELECT ?, COUNT(*) FROM {table}', (table,)
+            )
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS stats_{table}_insert AFTER INSERT ON {table}
+                BEGIN UPDATE stats SET value = value + 1 WHERE name = '{table}'; END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS stats_{table}_delete AFTER DELETE ON {table}
+                BEGIN UPDATE stats SET value = value - 1 WHERE name = '{table}'; END
+            ''')
+        
+        # Полнотекстовый индекс по кодам и подписям для inline-поиска. Таблица с внешним
+        # содержимым хранит только индекс, синхронизацию с movies ведут триггеры.
+        # rowid у movies неявный: после VACUUM индекс нужно перестроить ('rebuild')
+        fts_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies_fts'"
+        ).fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+                code, caption, content='movies', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+                INSERT INTO movies_fts (rowid, code, caption) VALUES (new.rowid, new.code, new.caption);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+                INSERT INTO movies_fts (movies_fts, rowid, code, caption) VALUES ('delete', old.rowid, old.code, old.caption);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF code, caption ON movies BEGIN
+                INSERT INTO movies_fts (movies_fts, rowid, code, caption) VALUES ('delete', old.rowid, old.code, old.caption);
+                INSERT INTO movies_fts (rowid, code, caption) VALUES (new.rowid, new.code, new.caption);
+            END
+        ''')
+        if not fts_exists:
+            # Фильмы, добавленные до появления индекса
+            cursor.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+        
         # Добавляем начальные каналы из config
         for channel_id, username in REQUIRED_CHANNELS.items():
             # Убедимся, что username начинается с @ и нет дублирования
@@ -60,92 +237,234 @@ class Database:
                 'INSERT OR IGNORE INTO channels (channel_id, username, title) VALUES (?, ?, ?)',
                 (channel_id, clean_username, None)
             )
-        
-        conn.commit()
-        conn.close()
-        print("✅ База данных инициализирована")
     
-    def add_movie(self, code, file_id, caption=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @staticmethod
+    def _add_column(cursor, table, column, definition):
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def close(self):
+        self.pool.close()
+    
+    async def load_catalog(self):
+        """Загружает фильмы в память (в LRU-режиме — только последние добавленные)"""
+        if self.catalog.is_lru:
+            rows = await self.pool.fetchall(
+                'SELECT code, file_id, caption FROM movies ORDER BY added_date DESC LIMIT ?',
+                (self.catalog.max_entries,)
+            )
+            # put ставит строку в «свежий» конец LRU: самые новые фильмы должны прийти последними
+            rows = rows[::-1]
+        else:
+            rows = await self.pool.fetchall('SELECT code, file_id, caption FROM movies')
+        self.catalog.load(rows)
+        # Индексу подсказок нужны все коды, даже если каталог в памяти неполный
+        if self.catalog.is_lru:
+            rows = await self.pool.fetchall('SELECT code FROM movies')
+        self.suggester.build(row[0] for row in rows)
+        print(f"✅ В память загружено фильмов: {len(self.catalog)}")
+    
+    def _upsert_movie(self, conn, code, file_id, caption, file_unique_id=None):
+        exists = conn.execute('SELECT 1 FROM movies WHERE code = ?', (code,)).fetchone() is not None
+        # Не INSERT OR REPLACE: REPLACE удаляет строку без DELETE-триггера и сбивает счётчик фильмов.
+        # Старый file_unique_id сохраняется, только пока код указывает на тот же file_id
+        conn.execute(
+            'INSERT INTO movies (code, file_id, caption, file_unique_id) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(code) DO UPDATE SET file_id = excluded.file_id, caption = excluded.caption, '
+            'file_unique_id = COALESCE(excluded.file_unique_id, '
+            'CASE WHEN movies.file_id = excluded.file_id THEN movies.file_unique_id END), '
+            'added_date = CURRENT_TIMESTAMP',
+            (code, file_id, caption, file_unique_id)
+        )
+        return not exists
+    
+    async def add_movie(self, code, file_id, caption=None, file_unique_id=None):
         try:
-            cursor.execute('INSERT OR REPLACE INTO movies (code, file_id, caption) VALUES (?, ?, ?)', 
-                         (code, file_id, caption))
-            conn.commit()
+            is_new = await self.pool.write(self._upsert_movie, code, file_id, caption, file_unique_id)
+            if is_new:
+                self.movie_filter.add(code)
+                self.suggester.add(code)
+            self.catalog.put(code, file_id, caption)
+            self.search_cache.clear()
             print(f"✅ Фильм #{code} добавлен в базу")
             return True
         except Exception as e:
             print(f"❌ Ошибка добавления фильма: {e}")
             return False
-        finally:
-            conn.close()
     
-    def get_movie(self, code):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT code, file_id, caption FROM movies WHERE code = ?', (code,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
-    
-    def delete_movie(self, code):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM movies WHERE code = ?', (code,))
-        conn.commit()
-        conn.close()
-        print(f"✅ Фильм #{code} удален")
-        return True
+    def _upsert_movies(self, conn, rows):
+        return [row[0] for row in rows if self._upsert_movie(conn, *row)]
+    
+    def _apply_added_movies(self, rows, new_codes):
+        for code in new_codes:
+            self.movie_filter.add(code)
+            self.suggester.add(code)
+        for code, file_id, caption, *_ in rows:
+            self.catalog.put(code, file_id, caption)
+        self.search_cache.clear()
+    
+    async def add_movies(self, rows):
+        """Добавляет пачку (code, file_id, caption[, file_unique_id]) одной транзакцией, возвращает число новых кодов"""
+        new_codes = await self.pool.write(self._upsert_movies, rows)
+        self._apply_added_movies(rows, new_codes)
+        return len(new_codes)
+    
+    async def get_archive_scan_position(self, channel_id):
+        result = await self.pool.fetchone(
+            'SELECT last_message_id FROM archive_scan_state WHERE channel_id = ?', (channel_id,)
+        )
+        return result[0] if result else 0
+    
+    async def save_archive_batch(self, channel_id, last_message_id, rows):
+        """Фильмы из архива и позиция сканирования сохраняются одной транзакцией"""
+        def write(conn):
+            new_codes = self._upsert_movies(conn, rows)
+            conn.execute(
+                'INSERT OR REPLACE INTO archive_scan_state (channel_id, last_message_id, updated_at) '
+                'VALUES (?, ?, CURRENT_TIMESTAMP)',
+                (channel_id, last_message_id)
+            )
+            return new_codes
+        new_codes = await self.pool.write(write)
+        self._apply_added_movies(rows, new_codes)
+        return len(new_codes)
+    
+    async def get_movie(self, code):
+        if not self.movie_filter.might_contain(code):
+            self.filter_rejections += 1
+            return None
+        movie = self.catalog.get(code)
+        if movie is not None or self.catalog.complete:
+            return movie
+        movie = await self.pool.fetchone('SELECT code, file_id, caption FROM movies WHERE code = ?', (code,))
+        if movie:
+            self.catalog.put(*movie)
+        return movie
     
-    def add_user(self, user_id, username=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)', (user_id, username))
-        conn.commit()
-        conn.close()
+    async def get_movies_by_file(self, file_unique_id):
+        """Фильмы, уже привязанные к этому файлу (по file_unique_id)"""
+        return await self.pool.fetchall(
+            'SELECT code, file_id, caption FROM movies WHERE file_unique_id = ? ORDER BY added_date', (file_unique_id,)
+        )
     
-    def update_user_activity(self, user_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+    async def get_duplicate_groups(self, limit=50):
+        """Файлы, к которым привязано больше одного кода: (file_unique_id, [коды]), крупные группы первыми"""
+        rows = await self.pool.fetchall(
+            'SELECT file_unique_id, GROUP_CONCAT(code, \' \') FROM movies WHERE file_unique_id IS NOT NULL '
+            'GROUP BY file_unique_id HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC, MIN(code) LIMIT ?',
+            (limit,)
+        )
+        return [(file_unique_id, codes.split()) for file_unique_id, codes in rows]
+    
+    def suggest_codes(self, code, limit=SUGGEST_LIMIT):
+        """Существующие коды, похожие на code (для ответа на опечатку)"""
+        return self.suggester.suggest(code, limit)
+    
+    async def search_movies(self, text, limit=INLINE_PAGE_SIZE, offset=0):
+        """Фильмы, в коде или подписи которых есть все слова text: лучшие совпадения (bm25) первыми"""
+        match = build_match_query(text)
+        if match is None:
+            return []
+        key = (match, limit, offset)
+        rows = self.search_cache.get(key)
+        if rows is None:
+            # При равной релевантности выше популярные фильмы
+            rows = await self.pool.fetchall(
+                'SELECT m.code, m.file_id, m.caption FROM movies_fts f JOIN movies m ON m.rowid = f.rowid '
+                'WHERE movies_fts MATCH ? ORDER BY f.rank, m.request_count DESC LIMIT ? OFFSET ?',
+                (match, limit, offset)
+            )
+            self.search_cache.put(key, rows)
+        return rows
     
-    def get_all_movies(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT code, caption FROM movies ORDER BY code')
-        result = cursor.fetchall()
-        conn.close()
-        return result
+    async def delete_movie(self, code):
+        deleted = await self.pool.execute('DELETE FROM movies WHERE code = ?', (code,))
+        self.catalog.remove(code)
+        if not deleted:
+            return False
+        self.movie_filter.remove(code)
+        self.suggester.remove(code)
+        self.search_cache.clear()
+        print(f"✅ Фильм #{code} удален")
+        return True
     
-    def movie_exists(self, code):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM movies WHERE code = ?', (code,))
-        result = cursor.fetchone() is not None
-        conn.close()
-        return result
+    async def add_user(self, user_id, username=None):
+        # Запись отложенная: см. UserWriteBehind
+        self.user_writes.add_user(user_id, username)
+        self.stats.mark_active(user_id)
+    
+    async def update_user_activity(self, user_id):
+        self.user_writes.touch(user_id)
+        self.stats.mark_active(user_id)
+    
+    async def get_all_movies(self):
+        return await self.pool.fetchall('SELECT code, caption FROM movies ORDER BY code')
+    
+    def _movies_page(self, conn, start, direction, limit):
+        if direction == 'prev':
+            rows = conn.execute(
+                'SELECT code, caption FROM movies WHERE code < ? ORDER BY code DESC LIMIT ?', (start, limit)
+            ).fetchall()[::-1]
+        elif start is None:
+            rows = conn.execute('SELECT code, caption FROM movies ORDER BY code LIMIT ?', (limit,)).fetchall()
+        else:
+            op = '>=' if direction == 'from' else '>'
+            rows = conn.execute(
+                f'SELECT code, caption FROM movies WHERE code {op} ? ORDER BY code LIMIT ?', (start, limit)
+            ).fetchall()
+        if not rows:
+            return rows, False, False
+        has_prev = conn.execute('SELECT 1 FROM movies WHERE code < ? LIMIT 1', (rows[0][0],)).fetchone() is not None
+        has_next = conn.execute('SELECT 1 FROM movies WHERE code > ? LIMIT 1', (rows[-1][0],)).fetchone() is not None
+        return rows, has_prev, has_next
+    
+    async def get_movies_page(self, start=None, direction='next', limit=MOVIES_PAGE_SIZE):
+        """Страница фильмов по ключу code: next — после start, prev — до start, from — начиная со start"""
+        return await self.pool.read(self._movies_page, start, direction, limit)
+    
+    async def movie_exists(self, code):
+        return await self.get_movie(code) is not None
+    
+    async def get_all_users(self):
+        return await self.pool.fetchall('SELECT user_id, username FROM users')
+    
+    @staticmethod
+    def _audience_filter(active_days):
+        """Условие выборки получателей рассылки: достижимые и, если задано, активные за N дней"""
+        if active_days:
+            return 'unreachable_reason IS NULL AND last_activity >= datetime(\'now\', ?)', (f'-{int(active_days)} days',)
+        return 'unreachable_reason IS NULL', ()
+    
+    async def get_user_ids_after(self, last_user_id, limit, active_days=None):
+        condition, params = self._audience_filter(active_days)
+        rows = await self.pool.fetchall(
+            f'SELECT user_id FROM users WHERE user_id > ? AND {condition} ORDER BY user_id LIMIT ?',
+            (last_user_id, *params, limit)
+        )
+        return [row[0] for row in rows]
+    
+    async def count_broadcast_audience(self, active_days=None):
+        condition, params = self._audience_filter(active_days)
+        result = await self.pool.fetchone(f'SELECT COUNT(*) FROM users WHERE {condition}', params)
+        return result[0]
+    
+    async def mark_users_unreachable(self, failures):
+        """failures: список пар (user_id, причина) для постоянных ошибок доставки"""
+        await self.pool.executemany(
+            'UPDATE users SET unreachable_reason = ?, unreachable_at = CURRENT_TIMESTAMP WHERE user_id = ?',
+            [(reason, user_id) for user_id, reason in failures]
+        )
     
-    def get_all_users(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id, username FROM users')
-        result = cursor.fetchall()
-        conn.close()
-        return result
+    async def get_users_count(self):
+        result = await self.pool.fetchone("SELECT value FROM stats WHERE name = 'users'")
+        return result[0]
     
-    def get_users_count(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM users')
-        result = cursor.fetchone()[0]
-        conn.close()
-        return result
+    async def get_movies_count(self):
+        result = await self.pool.fetchone("SELECT value FROM stats WHERE name = 'movies'")
+        return result[0]
     
-    def add_channel(self, channel_id, username, title=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    async def add_channel(self, channel_id, username, title=None):
         # Чистим username от лишних @
         clean_username = username.strip()
         if clean_username.startswith('@@'):
@@ -153,48 +472,151 @@ class Database:
         elif not clean_username.startswith('@'):
             clean_username = '@' + clean_username
             
-        cursor.execute('INSERT OR REPLACE INTO channels (channel_id, username, title) VALUES (?, ?, ?)', 
-                      (channel_id, clean_username, title))
-        conn.commit()
-        conn.close()
+        await self.pool.execute('INSERT OR REPLACE INTO channels (channel_id, username, title) VALUES (?, ?, ?)', 
+                                (channel_id, clean_username, title))
+        self._invalidate_channels()
         return True
     
-    def get_all_channels(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT channel_id, username, title FROM channels')
-        result = cursor.fetchall()
-        conn.close()
-        return result
-    
-    def delete_channel(self, channel_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM channels WHERE channel_id = ?', (channel_id,))
-        conn.commit()
-        conn.close()
+    async def get_all_channels(self):
+        """Каналы обязательной подписки; список держится в памяти до add_channel/delete_channel"""
+        if self._channels is None:
+            version = self._channels_version
+            channels = await self.pool.fetchall('SELECT channel_id, username, title FROM channels')
+            # Пока шло чтение, список могли изменить — тогда прочитанное уже устарело
+            if version != self._channels_version:
+                return channels
+            self._channels = channels
+        return list(self._channels)
+    
+    def _invalidate_channels(self):
+        self._channels = None
+        self._channels_version += 1
+    
+    async def delete_channel(self, channel_id):
+        await self.pool.execute('DELETE FROM channels WHERE channel_id = ?', (channel_id,))
+        self._invalidate_channels()
         return True
+    
+    BROADCAST_COLUMNS = ('id', 'admin_chat_id', 'from_chat_id', 'message_id', 'progress_message_id',
+                         'status', 'total', 'last_user_id', 'sent', 'failed', 'unreachable', 'segment_days')
+    
+    async def create_broadcast(self, admin_chat_id, from_chat_id, message_id, total, progress_message_id=None,
+                               segment_days=None):
+        def insert(conn):
+            return conn.execute(
+                'INSERT INTO broadcasts (admin_chat_id, from_chat_id, message_id, total, progress_message_id, segment_days) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (admin_chat_id, from_chat_id, message_id, total, progress_message_id, segment_days)
+            ).lastrowid
+        return await self.pool.write(insert)
+    
+    async def get_broadcast(self, broadcast_id):
+        row = await self.pool.fetchone(
+            f'SELECT {", ".join(self.BROADCAST_COLUMNS)} FROM broadcasts WHERE id = ?', (broadcast_id,)
+        )
+        return dict(zip(self.BROADCAST_COLUMNS, row)) if row else None
+    
+    async def get_running_broadcasts(self):
+        rows = await self.pool.fetchall(
+            f'SELECT {", ".join(self.BROADCAST_COLUMNS)} FROM broadcasts WHERE status = \'running\' ORDER BY id'
+        )
+        return [dict(zip(self.BROADCAST_COLUMNS, row)) for row in rows]
+    
+    async def save_broadcast_progress(self, broadcast_id, last_user_id, sent, failed, unreachable):
+        await self.pool.execute(
+            'UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, unreachable = ?, '
+            'updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            (last_user_id, sent, failed, unreachable, broadcast_id)
+        )
+    
+    async def finish_broadcast(self, broadcast_id, status='done'):
+        """status: done — разослано всем, failed — прервана ошибкой (после перезапуска не продолжается)"""
+        await self.pool.execute(
+            'UPDATE broadcasts SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?', (status, broadcast_id)
+        )
+    
+    async def get_channel_members(self):
+        return await self.pool.fetchall('SELECT channel_id, user_id, is_member FROM channel_members')
+    
+    async def set_channel_member(self, channel_id, user_id, is_member):
+        await self.pool.execute(
+            'INSERT OR REPLACE INTO channel_members (channel_id, user_id, is_member, updated_at) '
+            'VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+            (channel_id, user_id, int(is_member))
+        )
+    
+    async def delete_channel_members(self, channel_id):
+        await self.pool.execute('DELETE FROM channel_members WHERE channel_id = ?', (channel_id,))
 
 db = Database()
+membership_cache = MembershipCache(ttl=SUBSCRIPTION_CACHE_TTL, negative_ttl=SUBSCRIPTION_NEGATIVE_TTL)
+broadcaster = Broadcaster(
+    db, rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY,
+    chunk_size=BROADCAST_CHUNK_SIZE, progress_interval=BROADCAST_PROGRESS_INTERVAL
+)
+archive_scanner = ArchiveScanner(
+    db, ARCHIVE_CHANNEL_ID, batch_size=ARCHIVE_SCAN_BATCH_SIZE, max_gap=ARCHIVE_SCAN_MAX_GAP
+)
+membership_store = MembershipStore(db.set_channel_member, db.delete_channel_members)
+subscription_checker = SubscriptionChecker(
+    membership_cache, max_concurrency=SUBSCRIPTION_CHECK_CONCURRENCY, store=membership_store
+)
+flood_guard = FloodGuard(
+    rate=FLOOD_USER_RATE, burst=FLOOD_USER_BURST, global_rate=FLOOD_GLOBAL_RATE, max_users=FLOOD_MAX_USERS,
+    exempt=ADMIN_IDS
+)
+update_processor = PerUserUpdateProcessor(UPDATE_CONCURRENCY, on_arrival=flood_guard.admit)
+outbound_scheduler = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE, group_rate=OUTBOUND_GROUP_RATE,
+    chat_burst=OUTBOUND_CHAT_BURST, max_retries=OUTBOUND_MAX_RETRIES
+)
+metrics_server = MetricsServer()
 
-async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE):
-    """Проверяет подписку на все каналы из базы и возвращает список неподписанных"""
-    channels = db.get_all_channels()
-    not_subscribed = []
-    
-    for channel_id, username, title in channels:
+def queue_depths():
+    depths = {
+        'updates_waiting': update_processor.waiting,
+        'updates_active': update_processor.active,
+        'user_writes': db.user_writes.pending,
+        'broadcasts': broadcaster.active,
+        'albums': album_collector.pending,
+    }
+    waiting = outbound_scheduler.global_bucket.waiting
+    for priority, name in PRIORITY_NAMES.items():
+        depths[f'outbound_{name}'] = waiting.get(priority, 0)
+    return depths
+
+REGISTRY.gauge('bot_queue_depth', 'Глубина очередей', queue_depths, label='queue')
+REGISTRY.gauge('bot_cache_hit_ratio', 'Доля попаданий в кэши', lambda: {
+    'subscription': membership_cache.stats()['hit_rate'],
+    'catalog': db.catalog.stats()['hit_rate'],
+    'search': db.search_cache.stats()['hit_rate'],
+}, label='cache')
+REGISTRY.gauge('bot_subscription_store_hits', 'Проверки подписки без запросов к API', lambda: subscription_checker.store_hits)
+REGISTRY.gauge('bot_movie_filter_rejections', 'Коды, отсеянные фильтром без обращения к базе', lambda: db.filter_rejections)
+REGISTRY.gauge('bot_flood_guard_users', 'Пользователи с активным бакетом защиты от флуда', lambda: len(flood_guard))
+
+async def flood_guard_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отбрасывает лишние апдейты раньше всех остальных обработчиков (группа -1)"""
+    # Токены списаны при получении апдейта (FloodGuard.admit), здесь только решение
+    reason = flood_guard.verdict(update)
+    if reason is None:
+        return
+    user = update.effective_user
+    THROTTLED_UPDATES.inc(reason=reason)
+    if reason == 'user' and flood_guard.should_notify(user.id):
         try:
-            member = await context.bot.get_chat_member(channel_id, user_id)
-            if member.status in ['left', 'kicked']:
-                not_subscribed.append((channel_id, username, title))
-                logger.info(f"❌ Пользователь {user_id} не подписан на канал {username}")
-            else:
-                logger.info(f"✅ Пользователь {user_id} подписан на канал {username}")
+            if update.callback_query:
+                await update.callback_query.answer("⏳ Juda ko'p so'rov, biroz kuting")
+            elif update.message and update.effective_chat.type == 'private':
+                await update.message.reply_text("⏳ Juda ko'p so'rov yubordingiz. Biroz kutib, qayta urinib ko'ring.")
         except Exception as e:
-            logger.error(f"Ошибка проверки подписки на канал {channel_id} ({username}): {e}")
-            not_subscribed.append((channel_id, username, title))
-    
-    return not_subscribed
+            logger.warning(f"Не удалось предупредить пользователя {user.id} о лимите: {e}")
+    raise ApplicationHandlerStop
+
+async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Проверяет подписку на все каналы из базы и возвращает список неподписанных"""
+    channels = await db.get_all_channels()
+    return await subscription_checker.check(context.bot, user_id, channels)
 
 async def show_subscription_required(update: Update, context: ContextTypes.DEFAULT_TYPE, not_subscribed_channels):
     """Показывает кнопки для подписки на недостающие каналы"""
@@ -225,15 +647,46 @@ async def show_subscription_required(update: Update, context: ContextTypes.DEFAU
         logger.error(f"Obunani ko'rsatish xatosi: {e}")
         return False
 
+# Параметр /start из кнопки inline-поиска: просто приветствие с проверкой подписки
+SUBSCRIBE_START_PARAMETER = "subscribe"
+
+def deep_link_code(context: ContextTypes.DEFAULT_TYPE):
+    """Код фильма из ссылки t.me/bot?start=<код> или None"""
+    payload = context.args[0] if context.args else None
+    if payload and payload != SUBSCRIBE_START_PARAMETER and is_valid_code(payload):
+        return payload
+    return None
+
+async def deliver_movie_code(update: Update, context: ContextTypes.DEFAULT_TYPE, code):
+    """Фильм по коду из ссылки; True, если он отправлен"""
+    movie = await db.get_movie(code)
+    if not movie:
+        await update.effective_message.reply_text(
+            f"❌ Ushbu kod bilan video topilmadi\n\n"
+            f"📺 Kodlarini kanalimizda ko'rishingiz mumkin: {CODES_CHANNEL}"
+        )
+        return False
+    try:
+        # Пользователь пришёл по ссылке из канала с кодами, ссылка на него не нужна
+        await send_movie(context, update.effective_user.id, movie, with_channel_link=False)
+        return True
+    except Exception as e:
+        await update.effective_message.reply_text("❌ Ошибка при отправке видео")
+        return False
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.add_user(user.id, user.username)
-    db.update_user_activity(user.id)
+    await db.add_user(user.id, user.username)
+    await db.update_user_activity(user.id)
+    code = deep_link_code(context)
     
     # Для админов пропускаем проверку подписки
     if user.id in ADMIN_IDS:
-        movies_count = len(db.get_all_movies())
-        users_count = db.get_users_count()
+        if code:
+            await deliver_movie_code(update, context, code)
+            return
+        movies_count = await db.get_movies_count()
+        users_count = await db.get_users_count()
         
         await update.message.reply_text(
             f"👨‍💻 Добро пожаловать, администратор {user.first_name}!\n\n"
@@ -248,25 +701,51 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Для обычных пользователей проверяем подписку на ВСЕ каналы
     not_subscribed = await check_subscription(user.id, context)
     
-    if not not_subscribed:
+    if not_subscribed:
+        if code:
+            # Фильм придёт сам, когда пользователь подпишется и нажмёт «✅ Tekshirish»
+            context.user_data['pending_code'] = code
+        await show_subscription_required(update, context, not_subscribed)
+    elif code:
+        await deliver_movie_code(update, context, code)
+    else:
         await update.message.reply_text(
             f"🎬 Xush kelibsiz, {user.first_name}!\n\n"
             "Kodni kiriting videoni yuklab olish uchun.\n\n"
             f"📺 Video kodlarini kanalimizda ko'rishingiz mumkin: {CODES_CHANNEL}"
         )
-    else:
-        await show_subscription_required(update, context, not_subscribed)
+
+async def send_movie(context: ContextTypes.DEFAULT_TYPE, user_id, movie, with_channel_link=True):
+    """Отправляет фильм и ссылку на канал с кодами, учитывает выдачу в статистике"""
+    code, file_id, caption = movie
+    await context.bot.send_video(
+        chat_id=user_id,
+        video=file_id,
+        caption=caption or f"Kod bo'yicha film {code}",
+        protect_content=True
+    )
+    
+    # Отправляем ссылку на канал с кодами
+    if with_channel_link:
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=f"📺 Kodlarini kanalimizda ko'rishingiz mumkin: {CODES_CHANNEL}",
+            disable_web_page_preview=True
+        )
+    
+    db.stats.record_request(code)
+    logger.info(f"✅ Пользователь {user_id} получил фильм {code}")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    db.update_user_activity(user.id)
+    await db.update_user_activity(user.id)
     
     # Админы могут всё без проверки подписки
     if user.id in ADMIN_IDS:
         text = update.message.text.strip()
         
-        if text.isdigit() or re.match(r'^[a-zA-Z0-9]+$', text):
-            movie = db.get_movie(text)
+        if is_valid_code(text):
+            movie = await db.get_movie(text)
             if movie:
                 code, file_id, caption = movie
                 try:
@@ -290,40 +769,31 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     text = update.message.text.strip()
     
-    # Еще раз проверяем подписку (на случай если пользователь отправил код быстро)
-    not_subscribed = await check_subscription(user.id, context)
-    if not_subscribed:
-        await show_subscription_required(update, context, not_subscribed)
-        return
-    
-    if text.isdigit() or re.match(r'^[a-zA-Z0-9]+$', text):
-        movie = db.get_movie(text)
+    if is_valid_code(text):
+        # Пользователь уже подписан и ввёл код сам: отложенный код из ссылки больше не нужен
+        context.user_data.pop('pending_code', None)
+        movie = await db.get_movie(text)
         if movie:
-            code, file_id, caption = movie
             try:
-                # Отправляем фильм
-                await context.bot.send_video(
-                    chat_id=user.id,
-                    video=file_id,
-                    caption=caption or f"Kod bo'yicha film {code}",
-                    protect_content=True
-                )
-                
-                # Отправляем ссылку на канал с кодами
-                await context.bot.send_message(
-                    chat_id=user.id,
-                    text=f"📺 Kodlarini kanalimizda ko'rishingiz mumkin: {CODES_CHANNEL}",
-                    disable_web_page_preview=True
-                )
-                
-                logger.info(f"✅ Пользователь {user.id} получил фильм {code}")
+                await send_movie(context, user.id, movie)
             except Exception as e:
                 await update.message.reply_text("❌ Ошибка при отправке видео")
         else:
-            await update.message.reply_text(
-                f"❌ Ushbu kod bilan video topilmadi\n\n"
-                f"📺 Kodlarini kanalimizda ko'rishingiz mumkin: {CODES_CHANNEL}"
-            )
+            suggestions = db.suggest_codes(text)
+            if suggestions:
+                # Кнопка сразу присылает фильм — пользователю не нужно набирать код заново
+                keyboard = [[InlineKeyboardButton(f"🎬 #{code}", callback_data=f"movie:{code}")]
+                            for code in suggestions if len(f"movie:{code}".encode()) <= 64]
+                await update.message.reply_text(
+                    f"❌ Ushbu kod bilan video topilmadi\n\n"
+                    f"🤔 Balki siz quyidagi kodlardan birini nazarda tutgandirsiz:",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+            else:
+                await update.message.reply_text(
+                    f"❌ Ushbu kod bilan video topilmadi\n\n"
+                    f"📺 Kodlarini kanalimizda ko'rishingiz mumkin: {CODES_CHANNEL}"
+                )
     else:
         try:
             await update.message.delete()
@@ -341,25 +811,37 @@ async def handle_admin_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     message = update.message
+    if message.media_group_id:
+        # Альбом обрабатывается целиком, когда придут все его видео
+        album_collector.add(context.bot, message)
+        return
+    
     caption = message.caption or ""
     
-    code_match = re.search(r'#(\w+)', caption)
-    if not code_match:
+    code = extract_code(caption)
+    if not code:
         await message.reply_text("❌ Добавьте в подпись код в formatе #123")
         return
     
-    code = code_match.group(1)
-    
-    file_id = None
-    if message.video:
-        file_id = message.video.file_id
-    elif message.document and message.document.mime_type and 'video' in message.document.mime_type:
-        file_id = message.document.file_id
-    
+    file_id = extract_file_id(message)
     if not file_id:
         await message.reply_text("❌ Сообщение не содержит видео")
         return
     
+    # Тот же файл уже в каталоге: в архив повторно не отправляем
+    file_unique_id = extract_file_unique_id(message)
+    existing = await db.get_movies_by_file(file_unique_id)
+    if existing:
+        codes = [row[0] for row in existing]
+        if code in codes:
+            await message.reply_text(f"ℹ️ Фильм #{code} с этим видео уже есть, ничего не изменено")
+        elif await db.add_movie(code, file_id, caption, file_unique_id):
+            aliases = ", ".join(f"#{other}" for other in codes)
+            await message.reply_text(f"🔗 #{code} добавлен как псевдоним {aliases} (без повторной публикации)")
+        else:
+            await message.reply_text("❌ Ошибка добавления в базу")
+        return
+    
     try:
         if message.video:
             await context.bot.send_video(
@@ -374,7 +856,7 @@ async def handle_admin_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 caption=caption
             )
         
-        if db.add_movie(code, file_id, caption):
+        if await db.add_movie(code, file_id, caption, file_unique_id):
             await message.reply_text(f"✅ Фильм #{code} добавлен и опубликован!")
         else:
             await message.reply_text("❌ Ошибка добавления в базу")
@@ -382,18 +864,171 @@ async def handle_admin_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
     except Exception as e:
         await message.reply_text(f"❌ Ошибка публикации: {e}")
 
+async def import_album(bot, messages):
+    """Добавляет альбом целиком: #код у каждого видео или диапазон #101-#110 в подписи"""
+    first = messages[0]
+    captions = [message.caption or "" for message in messages]
+    
+    code_range = next((codes for codes in map(extract_code_range, captions) if codes), None)
+    if code_range is not None:
+        if len(code_range) != len(messages):
+            await first.reply_text(f"❌ В диапазоне {len(code_range)} кодов, а в альбоме {len(messages)} видео")
+            return
+        # Каждое видео в архиве получает свой #код, чтобы сканер архива его узнал
+        title = next(strip_code_range(caption) for caption in captions if extract_code_range(caption))
+        codes = code_range
+        captions = [f"#{code} {title}".strip() for code in codes]
+    else:
+        codes = [extract_code(caption) for caption in captions]
+        if not all(codes):
+            await first.reply_text("❌ Укажите #код в подписи каждого видео или диапазон кодов, например #101-#110")
+            return
+    if len(set(codes)) != len(codes):
+        await first.reply_text("❌ Коды в альбоме повторяются")
+        return
+    
+    rows, to_archive, aliases, unchanged = [], [], [], []
+    for message, code, caption in zip(messages, codes, captions):
+        file_id = extract_file_id(message)
+        file_unique_id = extract_file_unique_id(message)
+        if not file_id:
+            await first.reply_text(f"❌ Для #{code} в альбоме нет видео")
+            return
+        existing = [row[0] for row in await db.get_movies_by_file(file_unique_id)]
+        if code in existing:
+            unchanged.append(code)
+            continue
+        rows.append((code, file_id, caption, file_unique_id))
+        if existing:
+            aliases.append(code)
+        else:
+            to_archive.append((message, file_id, caption))
+    
+    try:
+        # Видео и документы Telegram в одном альбоме не смешивает
+        videos = [InputMediaVideo(file_id, caption=caption) for message, file_id, caption in to_archive if message.video]
+        documents = [InputMediaDocument(file_id, caption=caption)
+                     for message, file_id, caption in to_archive if not message.video]
+        for media in (videos, documents):
+            if len(media) > 1:
+                await bot.send_media_group(chat_id=ARCHIVE_CHANNEL_ID, media=media)
+            elif media and isinstance(media[0], InputMediaVideo):
+                # В альбоме должно быть хотя бы два элемента
+                await bot.send_video(chat_id=ARCHIVE_CHANNEL_ID, video=media[0].media, caption=media[0].caption)
+            elif media:
+                await bot.send_document(chat_id=ARCHIVE_CHANNEL_ID, document=media[0].media, caption=media[0].caption)
+    except Exception as e:
+        await first.reply_text(f"❌ Ошибка публикации альбома: {e}")
+        return
+    
+    try:
+        if rows:
+            await db.add_movies(rows)
+    except Exception as e:
+        logger.error(f"Ошибка добавления альбома в базу: {e}")
+        await first.reply_text("❌ Ошибка добавления в базу")
+        return
+    
+    published = [row[0] for row in rows if row[0] not in aliases]
+    text = f"✅ Альбом: опубликовано и добавлено {len(published)}"
+    text += (": " + ", ".join(f"#{code}" for code in published)) if published else ""
+    if aliases:
+        text += "\n🔗 Псевдонимы без повторной публикации: " + ", ".join(f"#{code}" for code in aliases)
+    if unchanged:
+        text += "\nℹ️ Уже были в базе: " + ", ".join(f"#{code}" for code in unchanged)
+    await first.reply_text(text)
+
+album_collector = AlbumCollector(import_album, window=ALBUM_COLLECT_WINDOW)
+
+async def suggested_movie_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка с подсказанным кодом: сразу присылает фильм"""
+    query = update.callback_query
+    user = query.from_user
+    await db.update_user_activity(user.id)
+    
+    not_subscribed = await check_subscription(user.id, context)
+    if not_subscribed:
+        await query.answer()
+        await show_subscription_required(update, context, not_subscribed)
+        return
+    
+    movie = await db.get_movie(query.data.split(":", 1)[1])
+    if not movie:
+        await query.answer("❌ Ushbu kod bilan video topilmadi", show_alert=True)
+        return
+    
+    await query.answer()
+    try:
+        await send_movie(context, user.id, movie)
+    except Exception as e:
+        await query.message.reply_text("❌ Ошибка при отправке видео")
+
+def movie_title(code, caption):
+    """Название для inline-результата: первая строка подписи без хэштегов"""
+    for line in (caption or "").splitlines():
+        title = " ".join(word for word in line.split() if not word.startswith("#"))
+        if title:
+            return title[:64]
+    return f"Kod {code}"
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-поиск по названию: @bot название → готовые видео из архива"""
+    query = update.inline_query
+    user = query.from_user
+    text = query.query.strip()
+    if not text:
+        await query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+    
+    if user.id not in ADMIN_IDS:
+        not_subscribed = await check_subscription(user.id, context)
+        if not_subscribed:
+            # Ответ зависит от пользователя, поэтому is_personal и короткий кэш
+            await query.answer(
+                [], cache_time=SUBSCRIPTION_NEGATIVE_TTL, is_personal=True,
+                button=InlineQueryResultsButton("📢 Kanallarga obuna bo'ling", start_parameter=SUBSCRIBE_START_PARAMETER)
+            )
+            return
+    
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    # Лишняя строка показывает, есть ли следующая страница
+    rows = await db.search_movies(text, limit=INLINE_PAGE_SIZE + 1, offset=offset)
+    results = [
+        InlineQueryResultCachedVideo(
+            id=code[:64],
+            video_file_id=file_id,
+            title=movie_title(code, caption),
+            description=f"#{code}",
+            caption=caption or f"Kod bo'yicha film {code}",
+        )
+        for code, file_id, caption in rows[:INLINE_PAGE_SIZE]
+    ]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(rows) > INLINE_PAGE_SIZE else ""
+    # Подписку проверяем сами, поэтому кэш Telegram должен быть личным
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True, next_offset=next_offset)
+
 async def check_subscription_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка кнопки проверки подписки"""
     query = update.callback_query
     await query.answer()
     
     user = query.from_user
-    db.update_user_activity(user.id)
+    await db.update_user_activity(user.id)
+    
+    # Пользователь говорит, что подписался — кэш для него больше не актуален
+    membership_cache.invalidate_user(user.id)
+    membership_store.invalidate_user(user.id)
+    subscription_checker.forget(user.id)
     
     # Проверяем подписку на ВСЕ каналы
     not_subscribed = await check_subscription(user.id, context)
     
-    if not not_subscribed:
+    pending_code = context.user_data.pop('pending_code', None) if not not_subscribed else None
+    if pending_code:
+        # Пользователь пришёл по ссылке с кодом: сразу отдаём фильм, без повторного ввода
+        await query.message.edit_text("✅ Ajoyib! Endi siz botdan foydalanishingiz mumkin.")
+        await deliver_movie_code(update, context, pending_code)
+    elif not not_subscribed:
         await query.message.edit_text(
             f"✅ Ajoyib! Endi siz botdan foydalanishingiz mumkin.\n\n"
             "Kodni kiriting videoni yuklab olish uchun.\n\n"
@@ -419,6 +1054,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("🎬 Список фильмов", callback_data="admin_movies")],
         [InlineKeyboardButton("📌 Каналы для подписки", callback_data="admin_channels")],
         [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
+        [InlineKeyboardButton("🔄 Обновить базу", callback_data="admin_refresh")],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -435,8 +1071,13 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
         await show_movies_management(query)
     elif query.data == "admin_channels":
         await show_channels_management(query)
+    elif query.data == "admin_refresh":
+        await refresh_database(query, context)
     elif query.data == "admin_broadcast":
-        await query.message.reply_text("📢 Для рассылки ответьте на сообщение командой /broadcast")
+        await query.message.reply_text(
+            "📢 Для рассылки ответьте на сообщение командой /broadcast\n"
+            "/broadcast 7 — только пользователям, активным за последние 7 дней"
+        )
     elif query.data == "admin_back":
         await admin_panel_callback(query)
     elif query.data == "add_channel":
@@ -452,47 +1093,178 @@ async def handle_admin_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def show_admin_stats(query):
     """Показать статистику"""
-    movies_count = len(db.get_all_movies())
-    users_count = db.get_users_count()
-    channels = db.get_all_channels()
+    counters = await db.stats.snapshot()
+    top_all = await db.stats.top_codes(5)
+    top_today = await db.stats.top_codes(5, days=1)
+    top_week = await db.stats.top_codes(5, days=7)
+    channels = await db.get_all_channels()
+    cache_stats = membership_cache.stats()
+    catalog_stats = db.catalog.stats()
+    filter_stats = db.movie_filter.stats()
+    suggester_stats = db.suggester.stats()
+    search_stats = db.search_cache.stats()
+    updates_stats = update_processor.stats()
+    outbound_stats = outbound_scheduler.stats()
+    flood_stats = flood_guard.stats()
+    outbound_waiting = ", ".join(f"{name} {count}" for name, count in outbound_stats['waiting'].items()) or "пусто"
     
     stats_text = f"""📊 Статистика бота:
 
-🎬 Фильмов: {movies_count}
-👥 Пользователей: {users_count}
+🎬 Фильмов: {counters.get('movies', 0)}
+👥 Пользователей: {counters.get('users', 0)}
+🟢 Активны сегодня: {counters.get('active_today', 0)}
+📥 Выдано фильмов: {counters.get('requests', 0)}
 📺 Каналов для подписки: {len(channels)}
+📦 Кэш подписок: {cache_stats['hits']} попаданий / {cache_stats['misses']} промахов ({cache_stats['hit_rate']:.0%})
+📋 Локальных подписок: {len(membership_store)} (ответов без API: {subscription_checker.store_hits})
+🗂 Каталог в памяти: {catalog_stats['entries']} ({catalog_stats['mode']}, {catalog_stats['memory_bytes'] / 1024:.0f} КБ, попаданий {catalog_stats['hit_rate']:.0%})
+🧮 Фильтр кодов: {filter_stats['memory_bytes'] / 1024:.0f} КБ, ложных срабатываний ~{filter_stats['estimated_fp_rate']:.2%} (цель {filter_stats['target_fp_rate']:.2%}), отсеяно {db.filter_rejections}
+🔤 Индекс подсказок: {suggester_stats['codes']} кодов, {suggester_stats['memory_bytes'] / 1024:.0f} КБ (до {suggester_stats['max_distance']} опечаток)
+🔍 Кэш поиска: {search_stats['entries']} запросов, попаданий {search_stats['hit_rate']:.0%}
+⚙️ Апдейты: обрабатывается {updates_stats['active']}/{updates_stats['max_concurrent']} (пик {updates_stats['peak_active']}), в очереди {updates_stats['waiting']}, всего {updates_stats['processed']}
+📤 Исходящие: очередь {outbound_waiting}, RetryAfter {outbound_stats['retry_after']}, повторов {outbound_stats['network_retries']}, ошибок {outbound_stats['failures']}
+🛡 Флуд: отброшено {sum(flood_stats['throttled'].values())} апдейтов, отслеживается {flood_stats['users']} пользователей
 
 Каналы:
 """
     for channel_id, username, title in channels:
         stats_text += f"• {title or username}\n"
     
+    for label, top in (("сегодня", top_today), ("за неделю", top_week), ("за всё время", top_all)):
+        if top:
+            stats_text += f"\n🔥 Популярные коды {label}:\n"
+            stats_text += "".join(f"• #{code} — {count}\n" for code, count in top)
+    
     keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(stats_text, reply_markup=reply_markup)
 
-async def show_movies_management(query):
-    """Управление фильмами"""
-    movies = db.get_all_movies()
+# Лимиты Telegram: callback_data — 64 байта, текст сообщения — 4096 символов
+CALLBACK_DATA_LIMIT = 64
+MESSAGE_TEXT_LIMIT = 4096
+# Коды, которые не влезают в callback_data кнопки листания: кнопка несёт хеш кода
+MOVIES_CURSOR_LIMIT = 1000
+movies_page_cursors = OrderedDict()
+
+def movies_page_button(text, direction, code):
+    data = f"movies_{direction}:{code}"
+    if len(data.encode()) > CALLBACK_DATA_LIMIT:
+        key = hashlib.sha1(code.encode()).hexdigest()[:16]
+        movies_page_cursors[key] = code
+        movies_page_cursors.move_to_end(key)
+        if len(movies_page_cursors) > MOVIES_CURSOR_LIMIT:
+            movies_page_cursors.popitem(last=False)
+        data = f"movies_{direction}#{key}"
+    return InlineKeyboardButton(text, callback_data=data)
+
+async def render_movies_page(start=None, direction='next'):
+    """Текст и клавиатура страницы списка фильмов"""
+    movies, has_prev, has_next = await db.get_movies_page(start, direction)
     
     if movies:
-        movies_text = "🎬 Список фильмов:\n\n"
+        header = "🎬 Список фильмов:\n\n"
+        footer = f"\n🗑️ Удалить фильм: /delete <код>"
+        lines = []
+        length = len(header) + len(footer)
         for code, caption in movies:
-            movies_text += f"• #{code} - {caption[:30]}...\n" if caption else f"• #{code}\n"
-        
-        movies_text += f"\n🗑️ Удалить фильм: /delete <код>"
+            line = f"• #{code} - {caption[:30]}...\n" if caption else f"• #{code}\n"
+            if length + len(line) > MESSAGE_TEXT_LIMIT:
+                break
+            lines.append(line)
+            length += len(line)
+        if len(lines) < len(movies):
+            # Остаток страницы покажет кнопка «вперёд»: она листает от последнего показанного кода
+            movies = movies[:max(1, len(lines))]
+            has_next = True
+        movies_text = (header + "".join(lines) + footer)[:MESSAGE_TEXT_LIMIT]
+    elif start is not None:
+        movies_text = f"📭 Фильмов с кодом от {start[:64]} нет"
     else:
         movies_text = "📭 Фильмов пока нет"
     
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    keyboard = []
+    navigation = []
+    if has_prev:
+        navigation.append(movies_page_button("⬅️", "prev", movies[0][0]))
+    if has_next:
+        navigation.append(movies_page_button("➡️", "next", movies[-1][0]))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🔎 Перейти к коду", callback_data="movies_jump")])
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_back")])
+    
+    return movies_text, InlineKeyboardMarkup(keyboard)
+
+async def refresh_database(query, context: ContextTypes.DEFAULT_TYPE):
+    """Запускает сканирование архив-канала в фоне"""
+    # Сканер пересылает всё видео архива в служебный чат — только для админов
+    if query.from_user.id not in ADMIN_IDS:
+        return
+    if archive_scanner.running:
+        await query.message.reply_text("⏳ Сканирование архива уже идёт")
+        return
+    
+    # Без ARCHIVE_SCAN_CHAT_ID пересылаем в личный чат админа, а не в чат, где нажата кнопка
+    scratch_chat_id = ARCHIVE_SCAN_CHAT_ID or query.from_user.id
+    
+    async def progress(report):
+        try:
+            await query.edit_message_text(format_report(report))
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс сканирования: {e}")
+    
+    async def run():
+        try:
+            report = await archive_scanner.scan(context.bot, scratch_chat_id, on_progress=progress)
+            await query.edit_message_text(format_report(report, finished=True))
+        except Exception as e:
+            logger.error(f"Ошибка сканирования архива: {e}")
+            await query.edit_message_text(f"❌ Ошибка сканирования: {e}\n\nПовторный запуск продолжит с последней сохранённой пачки")
     
+    await query.edit_message_text("🔄 Сканирую архив-канал...")
+    context.application.create_task(run())
+
+async def show_movies_management(query, start=None, direction='next'):
+    """Управление фильмами"""
+    movies_text, reply_markup = await render_movies_page(start, direction)
     await query.edit_message_text(movies_text, reply_markup=reply_markup)
 
+async def handle_movies_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание списка фильмов"""
+    query = update.callback_query
+    await query.answer()
+    if query.from_user.id not in ADMIN_IDS:
+        return
+    
+    if query.data == "movies_jump":
+        await query.message.reply_text("🔎 Отправьте /movies <код>, чтобы открыть список с этого кода")
+        return
+    
+    if "#" in query.data:
+        direction, _, key = query.data[len("movies_"):].partition("#")
+        code = movies_page_cursors.get(key)
+        if code is None:
+            # Кнопка осталась от прошлого запуска бота — начинаем список сначала
+            await show_movies_management(query)
+            return
+    else:
+        direction, _, code = query.data[len("movies_"):].partition(":")
+    await show_movies_management(query, code, direction)
+
+async def movies_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Список фильмов, начиная с указанного кода"""
+    user = update.effective_user
+    if user.id not in ADMIN_IDS:
+        return
+    
+    start = context.args[0].lstrip('#') if context.args else None
+    movies_text, reply_markup = await render_movies_page(start, 'from')
+    await update.message.reply_text(movies_text, reply_markup=reply_markup)
+
 async def show_channels_management(query):
     """Управление каналами для подписки"""
-    channels = db.get_all_channels()
+    channels = await db.get_all_channels()
     
     channels_text = "📌 Текущие каналы для подписки:\n\n"
     if channels:
@@ -514,7 +1286,7 @@ async def show_channels_management(query):
 
 async def show_delete_channel_menu(query):
     """Меню удаления каналов"""
-    channels = db.get_all_channels()
+    channels = await db.get_all_channels()
     
     if not channels:
         await query.message.reply_text("📭 Нет каналов для удаления")
@@ -534,7 +1306,9 @@ async def handle_delete_channel(query):
     """Обработчик удаления канала"""
     try:
         channel_id = int(query.data.split('_')[2])
-        if db.delete_channel(channel_id):
+        if await db.delete_channel(channel_id):
+            membership_cache.invalidate_channel(channel_id)
+            await membership_store.drop_channel(channel_id)
             await query.message.reply_text("✅ Канал удален!")
             await show_channels_management(query)
         else:
@@ -549,6 +1323,7 @@ async def admin_panel_callback(query):
         [InlineKeyboardButton("🎬 Список фильмов", callback_data="admin_movies")],
         [InlineKeyboardButton("📌 Каналы для подписки", callback_data="admin_channels")],
         [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
+        [InlineKeyboardButton("🔄 Обновить базу", callback_data="admin_refresh")],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -561,18 +1336,22 @@ async def broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if update.message.reply_to_message:
-        users = db.get_all_users()
-        success = 0
-        failed = 0
+        # /broadcast 7 — только тем, кто был активен за последние 7 дней
+        segment_days = None
+        if context.args:
+            # 0 дней означал бы «всем» — без явного числа дней рассылка и так уходит всем
+            if not context.args[0].isdigit() or int(context.args[0]) < 1:
+                await update.message.reply_text("❌ Использование: /broadcast [дней активности, от 1]")
+                return
+            segment_days = int(context.args[0])
         
-        for user_id, username in users:
-            try:
-                await update.message.reply_to_message.copy(user_id)
-                success += 1
-            except:
-                failed += 1
-        
-        await update.message.reply_text(f"✅ Рассылка завершена\nУспешно: {success}\nНе удалось: {failed}")
+        # Новые пользователи ещё могут лежать в буфере отложенной записи
+        await db.user_writes.flush()
+        source = update.message.reply_to_message
+        broadcast_id = await broadcaster.start(
+            context.bot, update.effective_chat.id, source.chat_id, source.message_id, segment_days=segment_days
+        )
+        logger.info(f"📢 Админ {user.id} запустил рассылку #{broadcast_id}")
     else:
         await update.message.reply_text("❌ Ответьте на сообщение для рассылки")
 
@@ -584,7 +1363,7 @@ async def delete_movie_command(update: Update, context: ContextTypes.DEFAULT_TYP
     
     if context.args:
         code = context.args[0]
-        if db.delete_movie(code):
+        if await db.delete_movie(code):
             await update.message.reply_text(f"✅ Фильм #{code} удален")
         else:
             await update.message.reply_text(f"❌ Фильм #{code} не найден")
@@ -603,7 +1382,9 @@ async def add_channel_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             username = context.args[1]
             title = " ".join(context.args[2:]) if len(context.args) > 2 else None
             
-            if db.add_channel(channel_id, username, title):
+            if await db.add_channel(channel_id, username, title):
+                membership_cache.invalidate_channel(channel_id)
+                await refresh_channel_tracking(context.bot, channel_id)
                 await update.message.reply_text(f"✅ Канал @{username} добавлен!")
             else:
                 await update.message.reply_text("❌ Ошибка добавления канала")
@@ -624,7 +1405,9 @@ async def delete_channel_command(update: Update, context: ContextTypes.DEFAULT_T
     if context.args:
         try:
             channel_id = int(context.args[0])
-            if db.delete_channel(channel_id):
+            if await db.delete_channel(channel_id):
+                membership_cache.invalidate_channel(channel_id)
+                await membership_store.drop_channel(channel_id)
                 await update.message.reply_text(f"✅ Канал удален!")
             else:
                 await update.message.reply_text("❌ Канал не найден")
@@ -633,8 +1416,105 @@ async def delete_channel_command(update: Update, context: ContextTypes.DEFAULT_T
     else:
         await update.message.reply_text("❌ Укажите ID канала: /deletechannel <id>")
 
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+async def refresh_channel_tracking(bot, channel_id):
+    """Проверяет, админ ли бот в канале: только тогда приходят апдейты chat_member"""
+    try:
+        member = await bot.get_chat_member(channel_id, bot.id)
+        membership_store.set_tracked(channel_id, member.status in ['administrator', 'creator'])
+    except Exception as e:
+        logger.error(f"Не удалось проверить права бота в канале {channel_id}: {e}")
+        membership_store.set_tracked(channel_id, False)
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обновляет локальное состояние подписок по апдейтам chat_member"""
+    change = update.chat_member
+    channel_ids = {channel_id for channel_id, username, title in await db.get_all_channels()}
+    if change.chat.id not in channel_ids:
+        return
+    await membership_store.apply_update(change.new_chat_member.user.id, change.chat.id, change.new_chat_member.status)
+
+async def track_my_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Следит за правами бота в каналах для подписки"""
+    change = update.my_chat_member
+    membership_store.set_tracked(change.chat.id, change.new_chat_member.status in ['administrator', 'creator'])
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Краткая сводка метрик для админа"""
+    user = update.effective_user
+    if user.id not in ADMIN_IDS:
+        return
+    
+    text = "📈 Метрики (кол-во, среднее / p95 мс):\n\n⚙️ Обработчики:\n"
+    for name, count, mean, p95 in summarize(HANDLER_SECONDS):
+        text += f"• {name}: {count}, {mean * 1000:.0f} / {p95 * 1000:.0f}\n"
+    text += "\n🗄 База:\n"
+    for name, count, mean, p95 in summarize(DB_SECONDS, limit=6):
+        text += f"• {name}: {count}, {mean * 1000:.1f} / {p95 * 1000:.0f}\n"
+    
+    api_calls = {}
+    for (method, outcome), count in API_REQUESTS.values.items():
+        ok, failed = api_calls.get(method, (0, 0))
+        api_calls[method] = (ok + count, failed) if outcome == 'ok' else (ok, failed + count)
+    text += "\n📡 Bot API (успешно / ошибок):\n"
+    for method, (ok, failed) in sorted(api_calls.items(), key=lambda item: -sum(item[1]))[:8]:
+        text += f"• {method}: {ok} / {failed}\n"
+    
+    cache_stats = membership_cache.stats()
+    catalog_stats = db.catalog.stats()
+    queues = ", ".join(f"{name} {depth}" for name, depth in queue_depths().items() if depth) or "пусто"
+    text += (
+        f"\n📦 Кэш подписок: {cache_stats['hit_rate']:.0%}, каталог: {catalog_stats['hit_rate']:.0%}\n"
+        f"📥 Очереди: {queues}"
+    )
+    
+    await update.message.reply_text(text)
+
+async def duplicates_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Коды, привязанные к одному и тому же видео"""
+    user = update.effective_user
+    if user.id not in ADMIN_IDS:
+        return
+    
+    groups = await db.get_duplicate_groups()
+    if not groups:
+        await update.message.reply_text("✅ Дубликатов в каталоге нет")
+        return
+    
+    text = f"🔁 Одно видео под несколькими кодами (групп: {len(groups)}):\n\n"
+    for file_unique_id, codes in groups:
+        line = "• " + ", ".join(f"#{code}" for code in codes) + "\n"
+        # Ограничение Telegram на длину сообщения
+        if len(text) + len(line) > 4000:
+            text += "…"
+            break
+        text += line
+    text += "\n🗑️ Лишние коды можно удалить: /delete <код>"
+    await update.message.reply_text(text)
+
+async def reconcile_members_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сверить локальные подписки с Telegram после простоя"""
+    user = update.effective_user
+    if user.id not in ADMIN_IDS:
+        return
+    
+    context.application.create_task(membership_store.reconcile(context.bot, rate=MEMBERSHIP_RECONCILE_RATE))
+    await update.message.reply_text(f"🔄 Сверка подписок запущена ({len(membership_store)} записей)")
+
+def build_application(token: str = BOT_TOKEN, base_url: str = None) -> Application:
+    """Собирает Application со всеми обработчиками; base_url — другой адрес Bot API (для тестов)"""
+    builder = (
+        Application.builder().token(token).concurrent_updates(update_processor)
+        # По умолчанию у Bot одно HTTP-соединение, и параллельные обработчики ждали бы друг друга
+        .connection_pool_size(UPDATE_CONCURRENCY).pool_timeout(10)
+        .rate_limiter(outbound_scheduler)
+        .post_init(post_init).post_shutdown(post_shutdown)
+    )
+    if base_url is not None:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    
+    # Защита от флуда срабатывает раньше всех обработчиков
+    application.add_handler(TypeHandler(Update, flood_guard_check), group=-1)
     
     # Обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -643,32 +1523,93 @@ def main():
     application.add_handler(CommandHandler("delete", delete_movie_command))
     application.add_handler(CommandHandler("addchannel", add_channel_command))
     application.add_handler(CommandHandler("deletechannel", delete_channel_command))
+    application.add_handler(CommandHandler("reconcile", reconcile_members_command))
+    application.add_handler(CommandHandler("movies", movies_command))
+    application.add_handler(CommandHandler("metrics", metrics_command))
+    application.add_handler(CommandHandler("duplicates", duplicates_command))
     
     # Обработчики сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Видео альбома без подписи тоже нужны: код может быть только у первого
     application.add_handler(MessageHandler(
-        (filters.VIDEO | filters.Document.ALL) & filters.CAPTION,
+        (filters.VIDEO | filters.Document.ALL) & (filters.CAPTION | filters.User(ADMIN_IDS)),
         handle_admin_video
     ))
     
+    # Апдейты о подписках в каналах
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.CHAT_MEMBER))
+    application.add_handler(ChatMemberHandler(track_my_chat_member, ChatMemberHandler.MY_CHAT_MEMBER))
+    
+    # Inline-поиск (inline-режим включается в @BotFather: /setinline)
+    application.add_handler(InlineQueryHandler(inline_search))
+    
     # Обработчики callback-кнопок
     application.add_handler(CallbackQueryHandler(check_subscription_callback, pattern="^check_subscription$"))
+    application.add_handler(CallbackQueryHandler(suggested_movie_callback, pattern="^movie:"))
     application.add_handler(CallbackQueryHandler(handle_admin_callback, pattern="^admin_"))
     application.add_handler(CallbackQueryHandler(handle_admin_callback, pattern="^add_channel$"))
     application.add_handler(CallbackQueryHandler(handle_admin_callback, pattern="^delete_channel$"))
     application.add_handler(CallbackQueryHandler(handle_admin_callback, pattern="^delete_channel_"))
     application.add_handler(CallbackQueryHandler(handle_admin_callback, pattern="^admin_back$"))
+    application.add_handler(CallbackQueryHandler(handle_movies_page, pattern="^movies_"))
     
     # Обработчик ошибок
     application.add_error_handler(error_handler)
+    instrument_handlers(application)
+    return application
+
+def main():
+    application = build_application()
     
     print("🤖 Бот запущен!")
     print("📺 Коды фильмов в канале:", CODES_CHANNEL)
     
-    application.run_polling()
+    # chat_member не приходит без явного allowed_updates
+    if WEBHOOK_URL:
+        # Без секрета публичный эндпоинт принял бы любой POST. setWebhook вызывается при каждом
+        # старте, так что случайный секрет на время работы процесса Telegram тоже узнает
+        secret_token = WEBHOOK_SECRET_TOKEN
+        if not secret_token:
+            secret_token = secrets.token_urlsafe(32)
+            logger.warning("WEBHOOK_SECRET_TOKEN не задан: сгенерирован случайный секрет на время работы")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error("Ошибка в боте:", exc_info=context.error)
 
+async def post_init(application: Application):
+    """Загружает каталог фильмов и локальное состояние подписок перед стартом"""
+    await db.load_catalog()
+    membership_store.load(await db.get_channel_members())
+    for channel_id, username, title in await db.get_all_channels():
+        await refresh_channel_tracking(application.bot, channel_id)
+    logger.info(f"📥 Загружено подписок: {len(membership_store)}, отслеживаемых каналов: {len(membership_store.tracked_channels)}")
+    db.user_writes.start()
+    await db.stats.load()
+    db.stats.start()
+    await broadcaster.resume(application.bot)
+    if METRICS_PORT:
+        await metrics_server.start(METRICS_HOST, METRICS_PORT)
+    if MEMBERSHIP_RECONCILE_ON_START:
+        application.create_task(membership_store.reconcile(application.bot, rate=MEMBERSHIP_RECONCILE_RATE))
+
+async def post_shutdown(application: Application):
+    """Дописывает отложенные данные и закрывает соединения с базой"""
+    await album_collector.stop()
+    await metrics_server.stop()
+    await broadcaster.stop()
+    await db.user_writes.stop()
+    await db.stats.stop()
+    db.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from telegram.error import BadRequest, Forbidden, TelegramError
+
+from outbound import PRIORITY_BROADCAST, priority_kwargs
+from ratelimit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+SENT = 'sent'
+# Причины, по которым писать пользователю больше нет смысла
+PERMANENT_FAILURES = {'blocked', 'deactivated', 'chat_not_found', 'forbidden'}
+
+
+def classify_send_error(error: Exception) -> str:
+    """Определяет причину неудачной отправки по ошибке Bot API"""
+    message = str(error).lower()
+    if isinstance(error, Forbidden):
+        if 'blocked' in message:
+            return 'blocked'
+        if 'deactivated' in message:
+            return 'deactivated'
+        return 'forbidden'
+    if isinstance(error, BadRequest):
+        if 'chat not found' in message or 'user not found' in message:
+            return 'chat_not_found'
+        return 'bad_request'
+    return 'transient'
+
+
+class Broadcaster:
+    """Фоновые рассылки с контрольными точками в таблице broadcasts.
+
+    Пользователи читаются из базы порциями по user_id (keyset), сообщения
+    копируются параллельно не быстрее rate в секунду. После каждой порции
+    прогресс сохраняется, поэтому после перезапуска рассылка продолжается
+    с последнего обработанного user_id.
+    """
+
+    def __init__(self, db, rate: float = 25, concurrency: int = 20, chunk_size: int = 200,
+                 progress_interval: float = 10):
+        self.db = db
+        self.limiter = AsyncTokenBucket(rate)
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    async def start(self, bot, admin_chat_id: int, from_chat_id: int, message_id: int, segment_days: int = None) -> int:
+        """Создаёт рассылку и запускает её в фоне, возвращает её id"""
+        total = await self.db.count_broadcast_audience(segment_days)
+        segment = f" (активные за {segment_days} дн.)" if segment_days else ""
+        progress = await bot.send_message(admin_chat_id, f"📢 Рассылка запускается... Получателей: {total}{segment}")
+        broadcast_id = await self.db.create_broadcast(
+            admin_chat_id, from_chat_id, message_id, total, progress.message_id, segment_days
+        )
+        job = await self.db.get_broadcast(broadcast_id)
+        self._spawn(bot, job)
+        return broadcast_id
+
+    async def resume(self, bot):
+        """Продолжает рассылки, прерванные перезапуском бота"""
+        for job in await self.db.get_running_broadcasts():
+            logger.info(f"📢 Продолжаю рассылку #{job['id']} с пользователя {job['last_user_id']}")
+            self._spawn(bot, job)
+
+    async def stop(self):
+        """Останавливает задачи; статус остаётся running, чтобы продолжить после старта"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _spawn(self, bot, job: dict):
+        task = asyncio.get_running_loop().create_task(self._run(bot, job))
+        self._tasks[job['id']] = task
+        task.add_done_callback(lambda t: self._tasks.pop(job['id'], None))
+
+    async def _run(self, bot, job: dict):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_user_id = job['last_user_id']
+        sent, failed, unreachable = job['sent'], job['failed'], job['unreachable']
+        started_at, done_at_start = time.monotonic(), sent + failed
+        last_report = 0.0
+
+        async def send(user_id):
+            async with semaphore:
+                return await self._send_one(bot, user_id, job['from_chat_id'], job['message_id'])
+
+        try:
+            while True:
+                user_ids = await self.db.get_user_ids_after(last_user_id, self.chunk_size, job['segment_days'])
+                if not user_ids:
+                    break
+                outcomes = await asyncio.gather(*(send(user_id) for user_id in user_ids))
+                dead = [(user_id, outcome) for user_id, outcome in zip(user_ids, outcomes)
+                        if outcome in PERMANENT_FAILURES]
+                if dead:
+                    # Следующие рассылки этих пользователей пропустят
+                    await self.db.mark_users_unreachable(dead)
+                sent += outcomes.count(SENT)
+                failed += len(outcomes) - outcomes.count(SENT)
+                unreachable += len(dead)
+                last_user_id = user_ids[-1]
+                await self.db.save_broadcast_progress(job['id'], last_user_id, sent, failed, unreachable)
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    await self._report(bot, job, sent, failed, unreachable, started_at, done_at_start)
+
+            await self.db.finish_broadcast(job['id'])
+            await self._report(bot, job, sent, failed, unreachable, started_at, done_at_start, finished=True)
+            logger.info(f"📢 Рассылка #{job['id']} завершена: успешно {sent}, не удалось {failed}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка рассылки #{job['id']}: {e}", exc_info=True)
+            # Без этого задача молча исчезла бы, а статус running подхватил бы только перезапуск
+            try:
+                await self.db.finish_broadcast(job['id'], status='failed')
+            except Exception as db_error:
+                logger.error(f"Не удалось отметить рассылку #{job['id']} как прерванную: {db_error}")
+            await self._report(bot, job, sent, failed, unreachable, started_at, done_at_start, error=e)
+
+    async def _send_one(self, bot, user_id: int, from_chat_id: int, message_id: int) -> str:
+        """Возвращает SENT или причину неудачи (см. classify_send_error).
+
+        Повторы — забота OutboundScheduler: он ждёт RetryAfter и повторяет сетевые
+        ошибки, но не таймаут отправки (сообщение могло дойти). Здесь ошибка,
+        с которой он не справился, только классифицируется.
+        """
+        await self.limiter.acquire()
+        try:
+            await bot.copy_message(
+                chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id,
+                **priority_kwargs(bot, PRIORITY_BROADCAST)
+            )
+            return SENT
+        except TelegramError as e:
+            return classify_send_error(e)
+
+    async def _report(self, bot, job: dict, sent: int, failed: int, unreachable: int, started_at: float,
+                      done_at_start: int, finished: bool = False, error: Exception = None):
+        done = sent + failed
+        total = max(job['total'] or 0, done)
+        if error is not None:
+            text = (
+                f"❌ Рассылка #{job['id']} прервана ошибкой: {error}\n"
+                f"Обработано: {done}/{total}\nУспешно: {sent}\nНе удалось: {failed}"
+            )
+        elif finished:
+            text = (
+                f"✅ Рассылка #{job['id']} завершена\nУспешно: {sent}\nНе удалось: {failed}\n"
+                f"Из них заблокировали бота или удалены: {unreachable}"
+            )
+        else:
+            elapsed = time.monotonic() - started_at
+            speed = (done - done_at_start) / elapsed if elapsed > 0 else 0
+            eta = f"{(total - done) / speed / 60:.0f} мин" if speed > 0 else "—"
+            percent = done / total if total else 1
+            text = (
+                f"📢 Рассылка #{job['id']}: {done}/{total} ({percent:.0%})\n"
+                f"Успешно: {sent}\nНе удалось: {failed} (недоступны: {unreachable})\n"
+                f"Скорость: {speed:.1f} сообщ./сек, осталось ~{eta}"
+            )
+        try:
+            await bot.edit_message_text(text, chat_id=job['admin_chat_id'], message_id=job['progress_message_id'])
+        except TelegramError as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки #{job['id']}: {e}")
@@ -0,0 +1,78 @@
+import sys
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+
+class MovieCatalog:
+    """Индекс фильмов в памяти: код → (code, file_id, caption).
+
+    При max_entries=0 в памяти держится весь каталог, и промах означает,
+    что такого кода нет. При max_entries>0 это LRU-кэш ограниченного
+    размера, и промах нужно проверять в базе.
+    """
+
+    def __init__(self, max_entries: int = 0):
+        self.max_entries = max_entries
+        self._movies: OrderedDict = OrderedDict()
+        # Пока каталог не загружен, промахам доверять нельзя
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def is_lru(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def complete(self) -> bool:
+        """True, если в памяти гарантированно все фильмы"""
+        return self.loaded and not self.is_lru
+
+    def load(self, rows: Iterable[Tuple]):
+        """Заполняет индекс строками (code, file_id, caption)"""
+        self._movies.clear()
+        for code, file_id, caption in rows:
+            self.put(code, file_id, caption)
+        self.loaded = True
+
+    def get(self, code: str) -> Optional[Tuple]:
+        movie = self._movies.get(code)
+        if movie is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.is_lru:
+            self._movies.move_to_end(code)
+        return movie
+
+    def put(self, code: str, file_id: str, caption: Optional[str] = None):
+        self._movies[code] = (code, file_id, caption)
+        if self.is_lru:
+            self._movies.move_to_end(code)
+            while len(self._movies) > self.max_entries:
+                self._movies.popitem(last=False)
+
+    def remove(self, code: str):
+        self._movies.pop(code, None)
+
+    def __len__(self):
+        return len(self._movies)
+
+    def memory_usage(self) -> int:
+        """Примерный объём индекса в байтах"""
+        total = sys.getsizeof(self._movies)
+        for code, movie in self._movies.items():
+            total += sys.getsizeof(code) + sys.getsizeof(movie)
+            total += sum(sys.getsizeof(field) for field in movie[1:] if field is not None)
+        return total
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'mode': 'lru' if self.is_lru else 'full',
+            'memory_bytes': self.memory_usage(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
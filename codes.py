@@ -0,0 +1,59 @@
+import re
+from typing import List, Optional
+
+# Код, который пользователь может прислать боту текстом
+CODE_PATTERN = re.compile(r'^[a-zA-Z0-9]+$')
+# Код в подписи к видео: #123
+CAPTION_CODE_PATTERN = re.compile(r'#(\w+)')
+# Диапазон кодов в подписи к альбому: #101-#110 (или #101-110)
+CAPTION_RANGE_PATTERN = re.compile(r'#(\d+)\s*[-–—]\s*#?(\d+)')
+# Больше видео в одном альбоме Telegram не бывает, с запасом на опечатки
+MAX_CODE_RANGE = 100
+
+
+def is_valid_code(text: str) -> bool:
+    """Те же правила, по которым handle_message принимает код"""
+    return text.isdigit() or CODE_PATTERN.match(text) is not None
+
+
+def extract_code(caption: Optional[str]) -> Optional[str]:
+    match = CAPTION_CODE_PATTERN.search(caption or "")
+    return match.group(1) if match else None
+
+
+def extract_code_range(caption: Optional[str]) -> Optional[List[str]]:
+    """Коды из диапазона #101-#110 по порядку; ведущие нули сохраняются (#001-#010)"""
+    match = CAPTION_RANGE_PATTERN.search(caption or "")
+    if not match:
+        return None
+    first, last = match.group(1), match.group(2)
+    if int(last) < int(first) or int(last) - int(first) >= MAX_CODE_RANGE:
+        return None
+    width = len(first) if first.startswith('0') else 0
+    return [str(number).zfill(width) for number in range(int(first), int(last) + 1)]
+
+
+def strip_code_range(caption: Optional[str]) -> str:
+    """Подпись без диапазона кодов (общее название серий)"""
+    return CAPTION_RANGE_PATTERN.sub('', caption or "").strip()
+
+
+def _video_file(message):
+    """Видео из сообщения: само видео или документ с video/* MIME"""
+    if message.video:
+        return message.video
+    if message.document and message.document.mime_type and 'video' in message.document.mime_type:
+        return message.document
+    return None
+
+
+def extract_file_id(message) -> Optional[str]:
+    """file_id видео из сообщения: само видео или документ с video/* MIME"""
+    video = _video_file(message)
+    return video.file_id if video else None
+
+
+def extract_file_unique_id(message) -> Optional[str]:
+    """file_unique_id того же видео: одинаков для одного файла, кто бы и когда его ни прислал"""
+    video = _video_file(message)
+    return video.file_unique_id if video else None
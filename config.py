@@ -16,4 +16,93 @@ REQUIRED_CHANNELS = {
     -1002774096741: "@azyro_azart"
 }
 
+# Путь к базе SQLite и размер пула соединений для чтения
+DATABASE_PATH = os.getenv("DATABASE_PATH", "movies.db")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
 
+# Время жизни кэша проверки подписки (сек): для подписанных и неподписанных
+SUBSCRIPTION_CACHE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_TTL", "300"))
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "15"))
+# Сколько запросов get_chat_member может идти одновременно
+SUBSCRIPTION_CHECK_CONCURRENCY = int(os.getenv("SUBSCRIPTION_CHECK_CONCURRENCY", "8"))
+
+# Сверка локальных подписок с Telegram при старте (после долгого простоя) и её скорость (запросов/сек)
+MEMBERSHIP_RECONCILE_ON_START = os.getenv("MEMBERSHIP_RECONCILE_ON_START", "0") == "1"
+MEMBERSHIP_RECONCILE_RATE = float(os.getenv("MEMBERSHIP_RECONCILE_RATE", "20"))
+
+# Сколько фильмов держать в памяти: 0 — весь каталог, иначе LRU указанного размера
+MOVIE_CATALOG_MAX_ENTRIES = int(os.getenv("MOVIE_CATALOG_MAX_ENTRIES", "0"))
+
+# Фильтр несуществующих кодов: ожидаемое число фильмов и допустимая доля ложных срабатываний
+MOVIE_FILTER_CAPACITY = int(os.getenv("MOVIE_FILTER_CAPACITY", "100000"))
+MOVIE_FILTER_FP_RATE = float(os.getenv("MOVIE_FILTER_FP_RATE", "0.01"))
+
+# Отложенная запись пользователей и их активности: период сброса (сек) и размер буфера
+USER_FLUSH_INTERVAL = float(os.getenv("USER_FLUSH_INTERVAL", "5"))
+USER_FLUSH_MAX_PENDING = int(os.getenv("USER_FLUSH_MAX_PENDING", "1000"))
+
+# Рассылка: сообщений в секунду (лимит Telegram ~30), параллельных отправок,
+# размер порции пользователей и период обновления прогресса (сек)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "200"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))
+
+# Сколько фильмов показывать на одной странице в админ-панели (1–100; длинную
+# страницу бот всё равно обрежет под лимит Telegram в 4096 символов)
+MOVIES_PAGE_SIZE = max(1, min(100, int(os.getenv("MOVIES_PAGE_SIZE", "20"))))
+
+# Как часто сохранять счётчики статистики в базу (сек)
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "30"))
+
+# Сканирование архив-канала («🔄 Обновить базу»): чат для временных пересылок
+# (0 — личный чат админа, нажавшего кнопку), размер пачки и сколько пропусков подряд считать концом канала
+ARCHIVE_SCAN_CHAT_ID = int(os.getenv("ARCHIVE_SCAN_CHAT_ID", "0"))
+ARCHIVE_SCAN_BATCH_SIZE = int(os.getenv("ARCHIVE_SCAN_BATCH_SIZE", "100"))
+ARCHIVE_SCAN_MAX_GAP = int(os.getenv("ARCHIVE_SCAN_MAX_GAP", "50"))
+
+# Режим webhook: если задан WEBHOOK_URL (публичный https-адрес бота), вместо long polling
+# поднимается HTTP-сервер на WEBHOOK_LISTEN:WEBHOOK_PORT, принимающий апдейты по пути WEBHOOK_PATH.
+# WEBHOOK_SECRET_TOKEN Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token;
+# если он не задан, бот генерирует случайный при каждом запуске
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8443")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN") or None
+
+# Сколько апдейтов обрабатывать одновременно (апдейты одного пользователя всегда идут по очереди)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+
+# Исходящие запросы к Bot API: сообщений в секунду на бота, на личный чат и на группу/канал,
+# сколько сообщений подряд можно отправить в один чат и сколько раз повторять запрос
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# Эндпоинт метрик Prometheus (GET /metrics); 0 — не поднимать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Подсказки «возможно, вы имели в виду» для несуществующих кодов: допустимое число опечаток и сколько кодов предлагать
+SUGGEST_MAX_DISTANCE = int(os.getenv("SUGGEST_MAX_DISTANCE", "1"))
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "3"))
+
+# Inline-поиск по названиям (@bot название): результатов на странице (не больше 50),
+# сколько секунд Telegram кэширует ответ, и кэш горячих запросов в процессе (сек, записей)
+INLINE_PAGE_SIZE = min(50, int(os.getenv("INLINE_PAGE_SIZE", "20")))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+
+# Сколько секунд ждать следующее видео альбома, прежде чем добавлять альбом целиком
+ALBUM_COLLECT_WINDOW = float(os.getenv("ALBUM_COLLECT_WINDOW", "2"))
+
+# Защита от флуда: апдейтов в секунду и запас подряд на пользователя, общий лимит апдейтов
+# в секунду (0 — без него) и сколько пользователей помнить одновременно
+FLOOD_USER_RATE = float(os.getenv("FLOOD_USER_RATE", "1"))
+FLOOD_USER_BURST = float(os.getenv("FLOOD_USER_BURST", "10"))
+FLOOD_GLOBAL_RATE = float(os.getenv("FLOOD_GLOBAL_RATE", "0"))
+FLOOD_MAX_USERS = int(os.getenv("FLOOD_MAX_USERS", "100000"))
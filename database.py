@@ -34,6 +34,12 @@ class Database:
                 )
             ''')
             
+            # Счётчик запросов по коду для топа популярных
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(movies)')]
+            if 'request_count' not in columns:
+                cursor.execute('ALTER TABLE movies ADD COLUMN request_count INTEGER NOT NULL DEFAULT 0')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_request_count ON movies (request_count)')
+            
             # Таблица каналов (для обязательной подписки)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS channels (
@@ -49,8 +55,11 @@ class Database:
     def add_movie(self, code: str, file_id: str, caption: str = None):
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            # Upsert вместо INSERT OR REPLACE, чтобы не сбивать счётчики из таблицы stats
             cursor.execute(
-                'INSERT OR REPLACE INTO movies (code, file_id, caption) VALUES (?, ?, ?)',
+                'INSERT INTO movies (code, file_id, caption) VALUES (?, ?, ?) '
+                'ON CONFLICT(code) DO UPDATE SET file_id = excluded.file_id, caption = excluded.caption, '
+                'added_date = CURRENT_TIMESTAMP',
                 (code, file_id, caption)
             )
             conn.commit()
@@ -145,8 +154,11 @@ class Database:
             conn.commit()
 
     def get_popular_codes(self, limit: int = 10) -> List[Tuple]:
-        # В будущем можно добавить счетчик запросов для каждого фильма
+        # request_count ведёт бот (см. StatsCounters), по нему есть индекс
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT code FROM movies ORDER BY added_date DESC LIMIT ?', (limit,))
+            cursor.execute(
+                'SELECT code, request_count FROM movies WHERE request_count > 0 '
+                'ORDER BY request_count DESC LIMIT ?', (limit,)
+            )
             return cursor.fetchall()
\ No newline at end of file
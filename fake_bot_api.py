@@ -0,0 +1,341 @@
+"""Локальная замена Telegram Bot API для тестов и замеров.
+
+Поднимает HTTP-сервер с путями /bot<token>/<method>, на которые можно
+направить telegram.Bot через base_url. История каналов загружается из
+JSON-файла вида {"<chat_id>": [<Message>, ...]}, где каждое сообщение —
+словарь в формате Bot API (message_id, caption, video/document, ...).
+
+Для нагрузочных замеров можно добавить задержку каждого ответа (latency)
+и лимит на отправку сообщений (flood_rate в сообщениях/сек): сверх лимита
+методы отправки отвечают 429 с retry_after, как настоящий Telegram.
+
+    python fake_bot_api.py --port 8081 --history archive.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+from ratelimit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class BotAPIError(Exception):
+    def __init__(self, error_code: int, description: str, retry_after: Optional[int] = None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.retry_after = retry_after
+
+
+class FakeBotAPI:
+    """Минимальный Bot API: хранит чаты в памяти и считает вызовы по методам"""
+
+    # Методы, на которые действует flood_rate
+    SENDING_METHODS = ('sendMessage', 'sendVideo', 'sendDocument', 'sendMediaGroup', 'forwardMessage', 'copyMessage')
+
+    def __init__(self, token: str = "123456:fake", history: Dict = None, bot_id: int = 123456,
+                 latency: float = 0.0, flood_rate: Optional[float] = None):
+        self.token = token
+        self.bot_id = bot_id
+        self.latency = latency
+        self.flood = AsyncTokenBucket(flood_rate) if flood_rate else None
+        self.flood_errors = 0
+        # Пользователи, которые ни на что не подписаны
+        self.non_members = set()
+        # Ответы на inline-запросы (answerInlineQuery) по порядку
+        self.inline_answers = []
+        # Чаты, которых «нет»: пересылка в них отвечает 400 chat not found
+        self.missing_chats = set()
+        self.chats: Dict[int, Dict[int, dict]] = {}
+        self.calls = Counter()
+        self._next_message_id: Dict[int, int] = {}
+        self._server = None
+        self.host = '127.0.0.1'
+        self.port = None
+        for chat_id, messages in (history or {}).items():
+            for message in messages:
+                self._store(int(chat_id), dict(message))
+        self.methods = {
+            'getMe': self.get_me,
+            'sendMessage': self.send_message,
+            'editMessageText': self.edit_message_text,
+            'sendVideo': self.send_video,
+            'sendDocument': self.send_document,
+            'sendMediaGroup': self.send_media_group,
+            'forwardMessage': self.forward_message,
+            'copyMessage': self.copy_message,
+            'deleteMessage': self.delete_message,
+            'getChatMember': self.get_chat_member,
+            'answerCallbackQuery': self.answer_callback_query,
+            'answerInlineQuery': self.answer_inline_query,
+            'setWebhook': self.ok,
+            'deleteWebhook': self.ok,
+        }
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'FakeBotAPI':
+        with open(path, encoding='utf-8') as f:
+            return cls(history=json.load(f), **kwargs)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    # Хранилище сообщений
+
+    def _chat(self, chat_id: int) -> dict:
+        return {'id': chat_id, 'type': 'channel' if chat_id < 0 else 'private'}
+
+    def _store(self, chat_id: int, message: dict) -> dict:
+        if 'message_id' not in message:
+            message['message_id'] = self._next_message_id.get(chat_id, 1)
+        self._next_message_id[chat_id] = max(self._next_message_id.get(chat_id, 1), message['message_id'] + 1)
+        message.setdefault('date', int(time.time()))
+        message['chat'] = self._chat(chat_id)
+        self.chats.setdefault(chat_id, {})[message['message_id']] = message
+        return message
+
+    def _get(self, chat_id: int, message_id: int) -> dict:
+        message = self.chats.get(chat_id, {}).get(message_id)
+        if message is None:
+            raise BotAPIError(400, "Bad Request: message not found")
+        return message
+
+    def _content(self, message: dict) -> dict:
+        return {key: value for key, value in message.items() if key not in ('message_id', 'date', 'chat')}
+
+    # Методы Bot API
+
+    async def ok(self, params):
+        return True
+
+    async def get_me(self, params):
+        return {'id': self.bot_id, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+
+    async def send_message(self, params):
+        return self._store(int(params['chat_id']), {'text': str(params.get('text', ''))})
+
+    async def edit_message_text(self, params):
+        message = self._get(int(params['chat_id']), int(params['message_id']))
+        message['text'] = str(params.get('text', ''))
+        return message
+
+    async def send_video(self, params):
+        video = {'file_id': str(params['video']), 'file_unique_id': f"u{params['video']}",
+                 'width': 0, 'height': 0, 'duration': 0}
+        return self._store(int(params['chat_id']), {'video': video, 'caption': params.get('caption')})
+
+    async def send_document(self, params):
+        document = {'file_id': str(params['document']), 'file_unique_id': f"u{params['document']}",
+                    'mime_type': 'video/mp4'}
+        return self._store(int(params['chat_id']), {'document': document, 'caption': params.get('caption')})
+
+    async def send_media_group(self, params):
+        chat_id = int(params['chat_id'])
+        media_group_id = f"g{self._next_message_id.get(chat_id, 1)}"
+        messages = []
+        for media in params['media']:
+            kind = media['type']
+            content = {'file_id': str(media['media']), 'file_unique_id': f"u{media['media']}"}
+            if kind == 'video':
+                content.update(width=0, height=0, duration=0)
+            else:
+                content['mime_type'] = 'video/mp4'
+            messages.append(self._store(chat_id, {kind: content, 'caption': media.get('caption'),
+                                                  'media_group_id': media_group_id}))
+        return messages
+
+    async def forward_message(self, params):
+        if int(params['chat_id']) in self.missing_chats:
+            raise BotAPIError(400, "Bad Request: chat not found")
+        from_chat_id = int(params['from_chat_id'])
+        try:
+            source = self._get(from_chat_id, int(params['message_id']))
+        except BotAPIError:
+            raise BotAPIError(400, "Bad Request: message to forward not found")
+        message = self._content(source)
+        message['forward_from_chat'] = self._chat(from_chat_id)
+        message['forward_date'] = source['date']
+        return self._store(int(params['chat_id']), message)
+
+    async def copy_message(self, params):
+        try:
+            source = self._get(int(params['from_chat_id']), int(params['message_id']))
+        except BotAPIError:
+            raise BotAPIError(400, "Bad Request: message to copy not found")
+        return {'message_id': self._store(int(params['chat_id']), self._content(source))['message_id']}
+
+    async def delete_message(self, params):
+        self._get(int(params['chat_id']), int(params['message_id']))
+        del self.chats[int(params['chat_id'])][int(params['message_id'])]
+        return True
+
+    async def get_chat_member(self, params):
+        user_id = int(params['user_id'])
+        status = 'administrator' if user_id == self.bot_id else 'left' if user_id in self.non_members else 'member'
+        user = {'id': user_id, 'is_bot': user_id == self.bot_id, 'first_name': str(user_id)}
+        if status == 'administrator':
+            return {'status': status, 'user': user, 'can_be_edited': False, 'is_anonymous': False,
+                    'can_manage_chat': True, 'can_delete_messages': True, 'can_manage_video_chats': True,
+                    'can_restrict_members': True, 'can_promote_members': False, 'can_change_info': True,
+                    'can_invite_users': True, 'can_post_messages': True, 'can_edit_messages': True,
+                    'can_pin_messages': True, 'can_post_stories': True, 'can_edit_stories': True,
+                    'can_delete_stories': True, 'can_manage_topics': False}
+        return {'status': status, 'user': user}
+
+    async def answer_callback_query(self, params):
+        return True
+
+    async def answer_inline_query(self, params):
+        self.inline_answers.append(params)
+        return True
+
+    # HTTP
+
+    async def call(self, method: str, params: dict):
+        """Вызов метода в обход HTTP; возвращает тело ответа Bot API"""
+        self.calls[method] += 1
+        handler = self.methods.get(method)
+        if handler is None:
+            return {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            if self.flood is not None and method in self.SENDING_METHODS and not self.flood.try_acquire():
+                self.flood_errors += 1
+                retry_after = max(1, math.ceil(self.flood.delay()))
+                raise BotAPIError(429, f"Too Many Requests: retry after {retry_after}", retry_after=retry_after)
+            return {'ok': True, 'result': await handler(params)}
+        except BotAPIError as e:
+            response = {'ok': False, 'error_code': e.error_code, 'description': e.description}
+            if e.retry_after is not None:
+                response['parameters'] = {'retry_after': e.retry_after}
+            return response
+
+    @staticmethod
+    def _parse_params(content_type: str, body: bytes) -> dict:
+        if not body:
+            return {}
+        if content_type.startswith('application/json'):
+            return json.loads(body)
+        params = {}
+        for key, value in parse_qsl(body.decode(), keep_blank_values=True):
+            # PTB кодирует сложные значения в JSON, простые строки передаёт как есть
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method_path = request_line.decode().split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                path = method_path[1] if len(method_path) > 1 else '/'
+                prefix = f"/bot{self.token}/"
+                if path.startswith(prefix):
+                    params = self._parse_params(headers.get('content-type', ''), body)
+                    response = await self.call(path[len(prefix):], params)
+                    status = 200 if response['ok'] else response['error_code']
+                else:
+                    response, status = {'ok': False, 'error_code': 401, 'description': 'Unauthorized'}, 401
+
+                payload = json.dumps(response).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.host = host
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"🧪 Фейковый Bot API слушает {self.base_url}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class FakeBotAPIThread:
+    """FakeBotAPI в отдельном потоке со своим event loop.
+
+    При замерах фейк не должен делить event loop с ботом: иначе разбор его
+    HTTP-запросов попадает во время работы обработчиков.
+    """
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.api.start())
+        self._started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.api.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+async def serve(args):
+    kwargs = {'token': args.token, 'latency': args.latency, 'flood_rate': args.flood_rate}
+    api = FakeBotAPI.from_file(args.history, **kwargs) if args.history else FakeBotAPI(**kwargs)
+    await api.start(args.host, args.port)
+    print(f"🧪 Bot API: {api.base_url} (токен {api.token})")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный фейковый Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default="123456:fake")
+    parser.add_argument("--history", help="JSON с историей каналов")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа (сек)")
+    parser.add_argument("--flood-rate", type=float, help="лимит отправки сообщений в секунду")
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,104 @@
+import time
+from collections import Counter
+from typing import Collection, Dict, Optional, Tuple
+
+from ratelimit import AsyncTokenBucket
+
+
+class FloodGuard:
+    """Ограничение частоты апдейтов: token bucket на пользователя и, по желанию, общий.
+
+    Бакеты пользователей — кортежи в словаре без блокировок, чтобы их можно
+    было держать сотнями тысяч. Бакет с полным запасом ничем не отличается
+    от нового, поэтому при переполнении такие бакеты выбрасываются; если
+    их меньше десятой части max_users, остаток добирается самыми давними.
+
+    Токен списывается в admit, когда апдейт только получен: апдейты одного
+    пользователя обрабатываются по очереди, и при проверке в момент обработки
+    пачка сообщений растянулась бы во времени и прошла бы лимит. Решение
+    забирает обработчик в группе -1 через verdict.
+    """
+
+    def __init__(self, rate: float = 1, burst: float = 10, global_rate: float = 0, max_users: int = 100_000,
+                 exempt: Collection[int] = ()):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.global_bucket = AsyncTokenBucket(global_rate) if global_rate else None
+        # user_id → (токены, время обновления, предупреждён ли пользователь)
+        self._buckets: Dict[int, Tuple[float, float, bool]] = {}
+        self.exempt = set(exempt)
+        # update_id → причина для отброшенных апдейтов, ещё не дошедших до обработчика
+        self._verdicts: Dict[int, str] = {}
+        self.throttled = Counter()
+        self.evicted = 0
+
+    def admit(self, update):
+        """Учитывает апдейт пользователя в момент получения (служебные апдейты и exempt — без лимита)"""
+        user = getattr(update, 'effective_user', None)
+        if user is None or user.id in self.exempt:
+            return
+        # effective_message охватывает и edited_message: правки тоже доходят до handle_message
+        if not (update.effective_message or update.callback_query or update.inline_query):
+            return
+        reason = self.check(user.id)
+        if reason is not None:
+            self._verdicts[update.update_id] = reason
+
+    def verdict(self, update) -> Optional[str]:
+        """Причина, по которой апдейт нужно отбросить, или None"""
+        return self._verdicts.pop(update.update_id, None)
+
+    def check(self, user_id: int) -> Optional[str]:
+        """None, если апдейт можно обрабатывать, иначе причина: 'user' или 'global'"""
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_users:
+                self._evict(now)
+            tokens, notified = self.burst, False
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            notified = bucket[2] and tokens < 1
+        if tokens < 1:
+            self._buckets[user_id] = (tokens, now, notified)
+            self.throttled['user'] += 1
+            return 'user'
+        if self.global_bucket is not None and not self.global_bucket.try_acquire():
+            self._buckets[user_id] = (tokens, now, False)
+            self.throttled['global'] += 1
+            return 'global'
+        self._buckets[user_id] = (tokens - 1, now, False)
+        return None
+
+    def should_notify(self, user_id: int) -> bool:
+        """True один раз за эпизод ограничения: отвечать на каждый лишний апдейт — тот же флуд"""
+        bucket = self._buckets.get(user_id)
+        if bucket is None or bucket[2]:
+            return False
+        self._buckets[user_id] = (bucket[0], bucket[1], True)
+        return True
+
+    def _evict(self, now: float):
+        # Каждый проход освобождает не меньше десятой части max_users, иначе при постоянном
+        # притоке новых пользователей полный проход повторялся бы почти на каждом из них
+        target = len(self._buckets) - self.max_users + max(1, self.max_users // 10)
+        idle = [user_id for user_id, (tokens, updated, _) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for user_id in idle:
+            del self._buckets[user_id]
+        # Не хватило простаивающих: добираем самыми давно созданными
+        if len(idle) < target:
+            for user_id in list(self._buckets)[:target - len(idle)]:
+                del self._buckets[user_id]
+        self.evicted += max(len(idle), target)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def stats(self) -> dict:
+        return {
+            'users': len(self),
+            'throttled': dict(self.throttled),
+            'evicted': self.evicted,
+        }
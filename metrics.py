@@ -0,0 +1,266 @@
+"""Метрики бота в формате Prometheus без внешних зависимостей.
+
+Гистограммы и счётчики обновляются на горячих путях (обработчики, вызовы
+Bot API, методы Database), значения вроде глубины очередей и попаданий
+в кэши снимаются функциями в момент чтения. Всё доступно по HTTP
+(GET /metrics на METRICS_HOST:METRICS_PORT) и в команде /metrics.
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: [счётчики по корзинам (+Inf последней), сумма, количество]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def quantile(self, q: float, key: Tuple) -> float:
+        """Оценка квантиля по корзинам: верхняя граница корзины, в которую он попал"""
+        counts, _, total = self.values[key]
+        rank, seen = q * total, 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        for key, (counts, total_sum, total_count) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket", _format_labels(self.labels + ('le',), key + (le,)), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, key), total_sum
+            yield f"{self.name}_count", _format_labels(self.labels, key), total_count
+
+
+class Gauge:
+    """Значение, которое вычисляется функцией при каждом чтении.
+
+    fn возвращает число или, если задана метка, словарь {значение метки: число}.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, fn: Callable, label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+
+    def read(self) -> Dict[Tuple, float]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            logger.warning(f"Не удалось получить метрику {self.name}: {e}")
+            return {}
+        if self.label is None:
+            return {(): value}
+        return {(key,): item for key, item in value.items()}
+
+    def samples(self):
+        labels = (self.label,) if self.label else ()
+        for key, value in self.read().items():
+            yield self.name, _format_labels(labels, key), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable, label: Optional[str] = None) -> Gauge:
+        return self._register(Gauge(name, help, fn, label))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'bot_handler_seconds', 'Время работы обработчиков апдейтов', ('handler',)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках апдейтов', ('handler',)
+)
+API_SECONDS = REGISTRY.histogram(
+    'bot_api_request_seconds', 'Время вызовов Bot API (с ожиданием лимитов и повторами)', ('method',)
+)
+API_REQUESTS = REGISTRY.counter(
+    'bot_api_requests_total', 'Вызовы Bot API по методам и результату', ('method', 'outcome')
+)
+DB_SECONDS = REGISTRY.histogram(
+    'bot_db_seconds', 'Время методов Database (с ожиданием пула соединений)', ('method',)
+)
+THROTTLED_UPDATES = REGISTRY.counter(
+    'bot_throttled_updates_total', 'Апдейты, отброшенные ограничением частоты', ('reason',)
+)
+
+
+def instrument_handlers(application):
+    """Оборачивает колбэки всех обработчиков Application в замер времени"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = _timed_handler(handler.callback)
+
+
+def _timed_handler(callback: Callable) -> Callable:
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started_at, handler=name)
+
+    return wrapper
+
+
+def timed_methods(histogram: Histogram, label: str = 'method'):
+    """Декоратор класса: замер времени всех публичных async-методов"""
+    def decorate(cls):
+        for name, fn in list(vars(cls).items()):
+            if not name.startswith('_') and inspect.iscoroutinefunction(fn):
+                setattr(cls, name, _timed_method(fn, histogram, {label: name}))
+        return cls
+    return decorate
+
+
+def _timed_method(fn: Callable, histogram: Histogram, labels: dict) -> Callable:
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started_at, **labels)
+    return wrapper
+
+
+def summarize(histogram: Histogram, limit: int = 8):
+    """Строки (метка, количество, среднее, p95) по убыванию суммарного времени"""
+    rows = []
+    for key, (counts, total_sum, total_count) in histogram.values.items():
+        if total_count:
+            rows.append((key[0] if key else '', total_count, total_sum / total_count,
+                         histogram.quantile(0.95, key), total_sum))
+    rows.sort(key=lambda row: row[4], reverse=True)
+    return [row[:4] for row in rows[:limit]]
+
+
+class MetricsServer:
+    """HTTP-эндпоинт для Prometheus: GET /metrics"""
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.registry = registry
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode(errors='replace').split()
+            if len(parts) > 1 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str, port: int):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
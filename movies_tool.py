@@ -0,0 +1,209 @@
+"""Импорт и экспорт каталога фильмов (CSV или JSONL с полями code, file_id, caption).
+
+Файлы читаются и пишутся потоково, в память попадает только текущая пачка,
+поэтому размер файла не ограничен. Коды проверяются по тем же правилам,
+что в handle_message. Бот держит каталог в памяти, поэтому после импорта
+в работающую базу бота нужно перезапустить.
+
+    python movies_tool.py import movies.csv
+    python movies_tool.py import movies.jsonl --on-conflict replace
+    python movies_tool.py export movies.jsonl
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from codes import is_valid_code
+from config import DATABASE_PATH
+
+FIELDS = ('code', 'file_id', 'caption')
+# file_unique_id у строк из файла неизвестен; старый сбрасывается, если код переехал на другой file_id
+UPSERT_SQL = (
+    'INSERT INTO movies (code, file_id, caption) VALUES (?, ?, ?) '
+    'ON CONFLICT(code) DO UPDATE SET file_id = excluded.file_id, caption = excluded.caption, '
+    'file_unique_id = CASE WHEN movies.file_id = excluded.file_id THEN movies.file_unique_id END'
+)
+# Сколько примеров конфликтов и ошибок показывать в отчёте
+MAX_EXAMPLES = 10
+# Ограничение SQLite на число параметров в одном запросе
+MAX_SQL_PARAMS = 500
+
+
+def detect_format(path: str, fmt: str = None) -> str:
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(f, fmt: str) -> Iterator[Tuple[int, Optional[dict]]]:
+    """Построчно отдаёт (номер строки, запись); вместо нечитаемой строки JSONL — (номер, None)"""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+    else:
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            yield line_no, row
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies'").fetchone() is None:
+        sys.exit(f"❌ В {db_path} нет таблицы movies: сначала запустите бота")
+    return conn
+
+
+class Importer:
+    def __init__(self, conn: sqlite3.Connection, on_conflict: str = 'skip', batch_size: int = 10_000):
+        self.conn = conn
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.report = {'read': 0, 'inserted': 0, 'updated': 0, 'duplicates': 0,
+                       'conflicts': 0, 'invalid': 0}
+        self.examples = []
+
+    def _example(self, text: str):
+        if len(self.examples) < MAX_EXAMPLES:
+            self.examples.append(text)
+
+    def _existing(self, codes) -> Dict[str, Tuple[str, str]]:
+        existing = {}
+        codes = list(codes)
+        for i in range(0, len(codes), MAX_SQL_PARAMS):
+            chunk = codes[i:i + MAX_SQL_PARAMS]
+            rows = self.conn.execute(
+                f'SELECT code, file_id, caption FROM movies WHERE code IN ({",".join("?" * len(chunk))})', chunk
+            )
+            existing.update((code, (file_id, caption)) for code, file_id, caption in rows)
+        return existing
+
+    def _write_batch(self, batch: Dict[str, Tuple[int, str, str]]):
+        existing = self._existing(batch)
+        rows = []
+        for code, (line_no, file_id, caption) in batch.items():
+            if code not in existing:
+                rows.append((code, file_id, caption))
+                self.report['inserted'] += 1
+                continue
+            old_file_id, old_caption = existing[code]
+            if old_file_id == file_id:
+                self.report['duplicates'] += 1
+                if self.on_conflict == 'replace' and old_caption != caption:
+                    rows.append((code, file_id, caption))
+                    self.report['updated'] += 1
+                continue
+            self.report['conflicts'] += 1
+            self._example(f"строка {line_no}: код {code} уже привязан к другому file_id")
+            if self.on_conflict == 'replace':
+                rows.append((code, file_id, caption))
+                self.report['updated'] += 1
+        with self.conn:
+            self.conn.executemany(UPSERT_SQL, rows)
+
+    def run(self, rows: Iterator[Tuple[int, dict]]) -> dict:
+        started_at = time.monotonic()
+        batch: Dict[str, Tuple[int, str, str]] = {}
+        for line_no, row in rows:
+            self.report['read'] += 1
+            if row is None:
+                self.report['invalid'] += 1
+                self._example(f"строка {line_no}: не JSON-объект")
+                continue
+            code = str(row.get('code') or '').strip().lstrip('#')
+            file_id = str(row.get('file_id') or '').strip()
+            caption = row.get('caption') or None
+            if not is_valid_code(code) or not file_id:
+                self.report['invalid'] += 1
+                self._example(f"строка {line_no}: некорректный код или пустой file_id")
+                continue
+            if code in batch:
+                # Повтор кода внутри файла: последняя строка побеждает только при replace
+                if batch[code][1] == file_id:
+                    self.report['duplicates'] += 1
+                else:
+                    self.report['conflicts'] += 1
+                    self._example(f"строка {line_no}: код {code} повторяется в файле с другим file_id")
+                if self.on_conflict != 'replace':
+                    continue
+            batch[code] = (line_no, file_id, caption)
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = {}
+        if batch:
+            self._write_batch(batch)
+        elapsed = time.monotonic() - started_at
+        self.report['elapsed'] = elapsed
+        self.report['rate'] = self.report['read'] / elapsed if elapsed > 0 else 0.0
+        return self.report
+
+
+def export_movies(conn: sqlite3.Connection, f, fmt: str) -> int:
+    count = 0
+    cursor = conn.execute('SELECT code, file_id, caption FROM movies ORDER BY code')
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+    for row in cursor:
+        if fmt == 'jsonl':
+            f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n')
+        else:
+            writer.writerow(row)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт и экспорт каталога фильмов")
+    parser.add_argument("--db", default=DATABASE_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="загрузить фильмы из файла")
+    import_parser.add_argument("path", help="CSV или JSONL; '-' — stdin")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+    import_parser.add_argument("--on-conflict", choices=("skip", "replace"), default="skip",
+                               help="что делать, если код уже привязан к другому file_id")
+    import_parser.add_argument("--batch-size", type=int, default=10_000)
+
+    export_parser = subparsers.add_parser("export", help="выгрузить каталог")
+    export_parser.add_argument("path", nargs="?", default="-", help="файл; по умолчанию stdout")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"))
+
+    args = parser.parse_args()
+    conn = connect(args.db)
+    fmt = detect_format(args.path, args.format)
+
+    if args.command == "import":
+        f = sys.stdin if args.path == "-" else open(args.path, encoding='utf-8', newline='')
+        with f:
+            importer = Importer(conn, on_conflict=args.on_conflict, batch_size=args.batch_size)
+            report = importer.run(read_rows(f, fmt))
+        print(
+            f"✅ Импорт завершён: прочитано {report['read']}, добавлено {report['inserted']}, "
+            f"обновлено {report['updated']}, дубликатов {report['duplicates']}, "
+            f"конфликтов {report['conflicts']}, с ошибками {report['invalid']} "
+            f"({report['rate']:.0f} строк/сек)",
+            file=sys.stderr
+        )
+        for example in importer.examples:
+            print(f"  • {example}", file=sys.stderr)
+    else:
+        f = sys.stdout if args.path == "-" else open(args.path, 'w', encoding='utf-8', newline='')
+        with f:
+            count = export_movies(conn, f, fmt)
+        print(f"✅ Выгружено фильмов: {count}", file=sys.stderr)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
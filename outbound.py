@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from metrics import API_REQUESTS, API_SECONDS
+from ratelimit import AsyncTokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета (rate_limit_args): меньше — важнее. 0 PTB не передаёт,
+# поэтому вызовы без rate_limit_args и считаются пользовательскими
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_BROADCAST = 2
+PRIORITY_NAMES = {PRIORITY_USER: 'user', PRIORITY_BACKGROUND: 'background', PRIORITY_BROADCAST: 'broadcast'}
+
+# Методы, на которые действуют лимиты Telegram на отправку сообщений
+SENDING_PREFIXES = ('send', 'copy', 'forward')
+
+
+def priority_kwargs(bot, priority: int) -> dict:
+    """rate_limit_args для вызова, если у бота есть планировщик (у telegram.Bot его нет)"""
+    return {'rate_limit_args': priority} if getattr(bot, 'rate_limiter', None) else {}
+
+
+class PriorityTokenBucket(AsyncTokenBucket):
+    """Token bucket, который при нехватке токенов выдаёт их сначала более важным запросам"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        super().__init__(rate, capacity)
+        self._waiters: List = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def waiting(self) -> Counter:
+        return Counter(priority for priority, _, future in self._waiters if not future.done())
+
+    async def acquire_priority(self, priority: int):
+        if not self._waiters and self.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            if self._waiters[0][2].done():
+                # Ожидающий отменён
+                heapq.heappop(self._waiters)
+                continue
+            if self.try_acquire():
+                heapq.heappop(self._waiters)[2].set_result(None)
+            else:
+                await asyncio.sleep(self.delay())
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    """Единый планировщик исходящих запросов к Bot API.
+
+    Отправка сообщений ограничена общим лимитом бота и лимитом на чат;
+    когда общий лимит исчерпан, токены получают сначала пользовательские
+    запросы, потом фоновые (сканер архива), потом рассылка. RetryAfter
+    приостанавливает всю отправку на указанное время, после чего запрос
+    повторяется; сетевые ошибки повторяются с экспоненциальной задержкой.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, group_rate: float = 20 / 60,
+                 chat_burst: float = 3, max_retries: int = 3, max_chat_buckets: int = 10_000):
+        self.global_bucket = PriorityTokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self._chat_buckets: Dict[Union[int, str], AsyncTokenBucket] = {}
+        # Чаты со своим лимитом (например, служебный чат сканера архива): chat_id → (rate, burst)
+        self._chat_rates: Dict[Union[int, str], Tuple[float, float]] = {}
+        self.requests = Counter()
+        self.retry_after = 0
+        self.network_retries = 0
+        self.failures = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def set_chat_rate(self, chat_id, rate: float, burst: float = None):
+        """Свой лимит для чата вместо chat_rate/group_rate"""
+        self._chat_rates[chat_id] = (rate, burst if burst is not None else max(self.chat_burst, rate))
+        self._chat_buckets.pop(chat_id, None)
+
+    def reset_chat_rate(self, chat_id):
+        self._chat_rates.pop(chat_id, None)
+        self._chat_buckets.pop(chat_id, None)
+
+    def _chat_bucket(self, chat_id) -> AsyncTokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._evict_idle()
+            if chat_id in self._chat_rates:
+                bucket = AsyncTokenBucket(*self._chat_rates[chat_id])
+            else:
+                is_group = isinstance(chat_id, str) or chat_id < 0
+                bucket = AsyncTokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _evict_idle(self):
+        # Бакет с полным запасом токенов ничем не отличается от нового
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if bucket.delay(bucket.capacity) == 0]:
+            del self._chat_buckets[chat_id]
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        started_at = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await self._process(callback, args, kwargs, endpoint, data, rate_limit_args)
+        except RetryAfter:
+            outcome = 'retry_after'
+            raise
+        except Forbidden:
+            outcome = 'forbidden'
+            raise
+        except BadRequest:
+            outcome = 'bad_request'
+            raise
+        except NetworkError:
+            outcome = 'network_error'
+            raise
+        except TelegramError:
+            outcome = 'error'
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started_at, method=endpoint)
+            API_REQUESTS.inc(method=endpoint, outcome=outcome)
+
+    async def _process(self, callback, args, kwargs, endpoint: str, data: Dict[str, Any],
+                       rate_limit_args: Optional[int]):
+        priority = rate_limit_args or PRIORITY_USER
+        self.requests[PRIORITY_NAMES.get(priority, priority)] += 1
+        sending = endpoint.startswith(SENDING_PREFIXES)
+        chat_id = data.get('chat_id')
+        if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+            chat_id = int(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            if sending:
+                if chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire()
+                await self.global_bucket.acquire_priority(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after += 1
+                if attempt == self.max_retries:
+                    self.failures += 1
+                    raise
+                logger.warning(f"⏳ RetryAfter {e.retry_after} сек на {endpoint}, приостанавливаю отправку")
+                if sending:
+                    self.global_bucket.pause(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
+            except BadRequest:
+                # BadRequest наследуется от NetworkError, но повторять его бессмысленно
+                raise
+            except (TimedOut, NetworkError) as e:
+                # Сообщение, отправка которого оборвалась по таймауту, могло уже дойти:
+                # повторяем только запросы, которые ничего не отправляют
+                if attempt == self.max_retries or (sending and isinstance(e, TimedOut)):
+                    self.failures += 1
+                    raise
+                self.network_retries += 1
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def stats(self) -> dict:
+        waiting = self.global_bucket.waiting
+        return {
+            'requests': dict(self.requests),
+            'waiting': {PRIORITY_NAMES.get(priority, priority): count for priority, count in waiting.items()},
+            'retry_after': self.retry_after,
+            'network_retries': self.network_retries,
+            'failures': self.failures,
+            'chat_buckets': len(self._chat_buckets),
+        }
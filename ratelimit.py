@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    """Асинхронный token bucket: rate токенов в секунду, запас до capacity"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Забирает токен без ожидания; False, если токенов нет"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """Сколько секунд ждать, пока появится нужное число токенов"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, (tokens - self._tokens) / self.rate)
+        return max(wait, self._paused_until - now)
+
+    async def acquire(self, tokens: float = 1):
+        # Lock держит очередь ожидающих в порядке FIFO
+        async with self._lock:
+            while True:
+                if self.try_acquire(tokens):
+                    return
+                await asyncio.sleep(self.delay(tokens))
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (например, после RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
@@ -0,0 +1,69 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+# Слова запроса: буквы и цифры любых алфавитов (апостроф в узбекской латинице — разделитель, как и в unicode61)
+_WORD = re.compile(r'\w+')
+
+
+def build_match_query(text: str, max_terms: int = 8) -> Optional[str]:
+    """Запрос пользователя → выражение FTS5 MATCH.
+
+    Каждое слово берётся в кавычки (никакого синтаксиса FTS5 от пользователя)
+    и ищется по префиксу, чтобы результаты появлялись по мере набора.
+    Все слова должны встретиться (AND). None, если слов нет.
+    """
+    words = _WORD.findall(text.lower())[:max_terms]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+class SearchCache:
+    """LRU-кэш результатов поиска с временем жизни записей.
+
+    Каталог меняют только админы, поэтому при добавлении или удалении
+    фильма кэш просто очищается целиком.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class SQLitePool:
+    """Долгоживущие соединения SQLite: пул читателей и отдельный поток-писатель.
+
+    Все запросы выполняются вне event loop, поэтому обработчики бота
+    не блокируются на дисковом вводе-выводе и fsync.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        # Писатель открываем первым: он переводит базу в режим WAL
+        self._writer = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="sqlite-writer",
+            initializer=self._open_connection,
+            initargs=(False,),
+        )
+        self._writer.submit(lambda: None).result()
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, readers),
+            thread_name_prefix="sqlite-reader",
+            initializer=self._open_connection,
+            initargs=(True,),
+        )
+
+    def _open_connection(self, readonly: bool):
+        # check_same_thread=False нужен только для закрытия из close(),
+        # запросы по каждому соединению идут строго из своего потока
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        if readonly:
+            conn.execute('PRAGMA query_only=ON')
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _call_read(self, fn: Callable, args: tuple):
+        return fn(self._local.conn, *args)
+
+    def _call_write(self, fn: Callable, args: tuple):
+        conn = self._local.conn
+        with conn:  # одна транзакция на вызов
+            return fn(conn, *args)
+
+    async def read(self, fn: Callable, *args) -> Any:
+        """Выполняет fn(conn, *args) на соединении из пула читателей"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._call_read, fn, args)
+
+    async def write(self, fn: Callable, *args) -> Any:
+        """Выполняет fn(conn, *args) в потоке-писателе в одной транзакции"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._call_write, fn, args)
+
+    def write_sync(self, fn: Callable, *args) -> Any:
+        """Синхронная запись — только для инициализации до запуска event loop"""
+        return self._writer.submit(self._call_write, fn, args).result()
+
+    async def fetchone(self, sql: str, params: tuple = ()) -> Optional[Tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: tuple = ()) -> List[Tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Выполняет изменяющий запрос и возвращает число затронутых строк"""
+        return await self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, seq_of_params) -> int:
+        return await self.write(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
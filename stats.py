@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from write_behind import PeriodicFlusher
+
+logger = logging.getLogger(__name__)
+
+
+def utc_today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def utc_days_ago(days: int) -> str:
+    return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+class StatsCounters(PeriodicFlusher):
+    """Счётчики для админ-статистики без полного чтения таблиц.
+
+    Число фильмов и пользователей поддерживают триггеры в таблице stats.
+    Счётчики вроде числа запросов копятся в памяти и периодически
+    дописываются туда же. Активные сегодня считаются по множеству user_id
+    в памяти, которое при старте восстанавливается по индексу last_activity.
+
+    Запросы по кодам тоже копятся в памяти и сбрасываются пачкой: в общий
+    счётчик movies.request_count (по нему индекс для топа) и в дневные
+    счётчики movie_requests для топа за день и неделю.
+    """
+
+    # Сколько дней хранить дневные счётчики по кодам
+    REQUEST_HISTORY_DAYS = 8
+
+    def __init__(self, pool, flush_interval: float = 30):
+        super().__init__(flush_interval)
+        self.pool = pool
+        self._pending: Dict[str, int] = {}
+        self._code_requests: Counter = Counter()
+        self._active_day: Optional[str] = None
+        self._active_users = set()
+        # Сброс по таймеру и сброс при остановке не должны идти одновременно
+        self._lock = asyncio.Lock()
+
+    def increment(self, name: str, delta: int = 1):
+        self._pending[name] = self._pending.get(name, 0) + delta
+
+    def record_request(self, code: str):
+        """Учитывает выдачу фильма по коду"""
+        self.increment('requests')
+        self._code_requests[(utc_today(), code)] += 1
+
+    def mark_active(self, user_id: int):
+        today = utc_today()
+        if today != self._active_day:
+            self._active_day = today
+            self._active_users = set()
+        self._active_users.add(user_id)
+
+    @property
+    def active_today(self) -> int:
+        return len(self._active_users) if self._active_day == utc_today() else 0
+
+    async def load(self):
+        """Восстанавливает активных за сегодня по индексу users.last_activity"""
+        rows = await self.pool.fetchall("SELECT user_id FROM users WHERE last_activity >= date('now')")
+        self._active_day = utc_today()
+        self._active_users.update(row[0] for row in rows)
+
+    def _write(self, conn, pending, code_requests, active_today):
+        conn.executemany(
+            'INSERT INTO stats (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+            list(pending.items())
+        )
+        conn.execute('INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)', ('active_today', active_today))
+        if not code_requests:
+            return
+        totals = Counter()
+        for (day, code), count in code_requests.items():
+            totals[code] += count
+        conn.executemany(
+            'UPDATE movies SET request_count = request_count + ? WHERE code = ?',
+            [(count, code) for code, count in totals.items()]
+        )
+        conn.executemany(
+            'INSERT INTO movie_requests (day, code, count) VALUES (?, ?, ?) '
+            'ON CONFLICT(day, code) DO UPDATE SET count = count + excluded.count',
+            [(day, code, count) for (day, code), count in code_requests.items()]
+        )
+        conn.execute('DELETE FROM movie_requests WHERE day < ?', (utc_days_ago(self.REQUEST_HISTORY_DAYS),))
+
+    async def flush(self):
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            code_requests, self._code_requests = self._code_requests, Counter()
+            try:
+                # Отмена flush не должна отменять саму запись: данные уже вынуты из буфера
+                await asyncio.shield(self.pool.write(self._write, pending, code_requests, self.active_today))
+            except Exception as e:
+                logger.error(f"Ошибка записи статистики: {e}")
+                for name, delta in pending.items():
+                    self.increment(name, delta)
+                self._code_requests.update(code_requests)
+
+    async def snapshot(self) -> Dict[str, int]:
+        """Все счётчики: сохранённые в базе плюс ещё не сброшенные"""
+        result = dict(await self.pool.fetchall('SELECT name, value FROM stats'))
+        for name, delta in self._pending.items():
+            result[name] = result.get(name, 0) + delta
+        result['active_today'] = self.active_today
+        return result
+
+    async def top_codes(self, limit: int = 10, days: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Самые запрашиваемые коды: за всё время (по индексу) или за последние days дней"""
+        if days is None:
+            return await self.pool.fetchall(
+                'SELECT code, request_count FROM movies WHERE request_count > 0 '
+                'ORDER BY request_count DESC LIMIT ?', (limit,)
+            )
+        return await self.pool.fetchall(
+            'SELECT r.code, SUM(r.count) AS total FROM movie_requests r JOIN movies m ON m.code = r.code '
+            'WHERE r.day >= ? GROUP BY r.code ORDER BY total DESC LIMIT ?',
+            (utc_days_ago(days - 1), limit)
+        )
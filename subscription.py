@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipCache:
+    """TTL-кэш результатов get_chat_member по паре (пользователь, канал).
+
+    Положительные ответы живут ttl секунд, отрицательные — negative_ttl,
+    чтобы только что подписавшийся пользователь не ждал долго.
+    """
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 15, max_entries_per_channel: int = 100_000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries_per_channel = max_entries_per_channel
+        self._channels: Dict[int, OrderedDict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, channel_id: int) -> Optional[bool]:
+        """Возвращает закэшированный статус подписки или None"""
+        entries = self._channels.get(channel_id)
+        entry = entries.get(user_id) if entries is not None else None
+        if entry is None:
+            self.misses += 1
+            return None
+        is_member, expires_at = entry
+        if expires_at <= time.monotonic():
+            del entries[user_id]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return is_member
+
+    def set(self, user_id: int, channel_id: int, is_member: bool):
+        entries = self._channels.setdefault(channel_id, OrderedDict())
+        ttl = self.ttl if is_member else self.negative_ttl
+        entries[user_id] = (is_member, time.monotonic() + ttl)
+        entries.move_to_end(user_id)
+        # Вытесняем самые старые записи, чтобы память не росла бесконечно
+        while len(entries) > self.max_entries_per_channel:
+            entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        for entries in self._channels.values():
+            entries.pop(user_id, None)
+
+    def invalidate_channel(self, channel_id: int):
+        self._channels.pop(channel_id, None)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._channels.values())
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self),
+        }
+
+
+class SubscriptionChecker:
+    """Проверка подписки на все каналы сразу.
+
+    Запросы get_chat_member по разным каналам идут параллельно, но не более
+    max_concurrency одновременно на весь бот. Одновременные проверки одного
+    и того же пользователя склеиваются в одну (single-flight).
+    """
+
+    def __init__(self, cache: MembershipCache, max_concurrency: int = 8, store: Optional['MembershipStore'] = None):
+        self.cache = cache
+        self.store = store
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.coalesced = 0
+        self.store_hits = 0
+
+    async def check(self, bot, user_id: int, channels: List[Tuple]) -> List[Tuple]:
+        """Возвращает список каналов (channel_id, username, title), на которые пользователь не подписан"""
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._check_all(bot, user_id, channels))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda t: self._forget(user_id, t))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного из ожидающих не должна отменять общую проверку
+        return list(await asyncio.shield(task))
+
+    def forget(self, user_id: int):
+        """Следующая проверка пользователя не присоединится к уже идущей"""
+        self._inflight.pop(user_id, None)
+
+    def _forget(self, user_id: int, task: asyncio.Future):
+        if self._inflight.get(user_id) is task:
+            del self._inflight[user_id]
+
+    async def _check_all(self, bot, user_id: int, channels: List[Tuple]) -> List[Tuple]:
+        results = await asyncio.gather(*(
+            self._check_channel(bot, user_id, channel_id, username) for channel_id, username, title in channels
+        ))
+        return [channel for channel, is_member in zip(channels, results) if not is_member]
+
+    async def _check_channel(self, bot, user_id: int, channel_id: int, username: str) -> bool:
+        tracked = self.store is not None and self.store.is_tracked(channel_id)
+        if tracked:
+            is_member = self.store.get(user_id, channel_id)
+            if is_member is not None:
+                self.store_hits += 1
+                return is_member
+        else:
+            is_member = self.cache.get(user_id, channel_id)
+            if is_member is not None:
+                return is_member
+        try:
+            async with self._semaphore:
+                member = await bot.get_chat_member(channel_id, user_id)
+        except Exception as e:
+            # Ошибки не кэшируем: при следующем сообщении спросим ещё раз
+            logger.error(f"Ошибка проверки подписки на канал {channel_id} ({username}): {e}")
+            return False
+        is_member = member.status not in ['left', 'kicked']
+        if tracked:
+            # Дальше изменения по этому пользователю придут апдейтами chat_member
+            await self.store.record(user_id, channel_id, is_member)
+        else:
+            self.cache.set(user_id, channel_id, is_member)
+        if is_member:
+            logger.info(f"✅ Пользователь {user_id} подписан на канал {username}")
+        else:
+            logger.info(f"❌ Пользователь {user_id} не подписан на канал {username}")
+        return is_member
+
+
+class MembershipStore:
+    """Локальное состояние подписок, которое поддерживают апдейты chat_member.
+
+    Работает только для каналов, где бот — администратор (tracked): только там
+    Telegram присылает chat_member. Для таких каналов ответ берётся из памяти,
+    а get_chat_member нужен лишь для пользователей, которых мы ещё не видели.
+    Состояние дублируется в таблицу channel_members через persist/delete.
+    """
+
+    def __init__(self, persist, delete_channel=None):
+        self._persist = persist
+        self._delete_channel = delete_channel
+        self._members: Dict[int, Dict[int, bool]] = {}
+        self.tracked_channels = set()
+        self.updates_applied = 0
+
+    def load(self, rows):
+        """Загружает строки (channel_id, user_id, is_member) из базы"""
+        for channel_id, user_id, is_member in rows:
+            self._members.setdefault(channel_id, {})[user_id] = bool(is_member)
+
+    def is_tracked(self, channel_id: int) -> bool:
+        return channel_id in self.tracked_channels
+
+    def set_tracked(self, channel_id: int, tracked: bool):
+        if tracked:
+            self.tracked_channels.add(channel_id)
+        else:
+            self.tracked_channels.discard(channel_id)
+
+    def get(self, user_id: int, channel_id: int) -> Optional[bool]:
+        members = self._members.get(channel_id)
+        return members.get(user_id) if members is not None else None
+
+    async def record(self, user_id: int, channel_id: int, is_member: bool):
+        members = self._members.setdefault(channel_id, {})
+        if members.get(user_id) == is_member:
+            return
+        members[user_id] = is_member
+        await self._persist(channel_id, user_id, is_member)
+
+    async def apply_update(self, user_id: int, channel_id: int, status: str):
+        """Применяет апдейт chat_member"""
+        self.tracked_channels.add(channel_id)
+        self.updates_applied += 1
+        await self.record(user_id, channel_id, status not in ['left', 'kicked'])
+
+    def invalidate_user(self, user_id: int):
+        """Забывает отрицательные ответы, чтобы перепроверить их через API"""
+        for members in self._members.values():
+            if members.get(user_id) is False:
+                del members[user_id]
+
+    async def drop_channel(self, channel_id: int):
+        self._members.pop(channel_id, None)
+        self.tracked_channels.discard(channel_id)
+        if self._delete_channel is not None:
+            await self._delete_channel(channel_id)
+
+    def known_pairs(self):
+        """Снимок всех известных пар (channel_id, user_id) для сверки"""
+        return [(channel_id, user_id) for channel_id, members in self._members.items() for user_id in members]
+
+    async def reconcile(self, bot, rate: float = 20):
+        """Перепроверяет все известные пары через API после простоя бота.
+
+        Пока идёт сверка, проверки отвечают по старому локальному состоянию.
+        """
+        changed = 0
+        pairs = [pair for pair in self.known_pairs() if pair[0] in self.tracked_channels]
+        logger.info(f"🔄 Сверка подписок: {len(pairs)} записей")
+        for channel_id, user_id in pairs:
+            try:
+                member = await bot.get_chat_member(channel_id, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка сверки подписки {user_id} на канал {channel_id}: {e}")
+                continue
+            is_member = member.status not in ['left', 'kicked']
+            if self.get(user_id, channel_id) != is_member:
+                changed += 1
+                await self.record(user_id, channel_id, is_member)
+            await asyncio.sleep(1 / rate)
+        logger.info(f"✅ Сверка подписок завершена: изменено {changed} из {len(pairs)}")
+        return changed
+
+    def __len__(self):
+        return sum(len(members) for members in self._members.values())
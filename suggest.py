@@ -0,0 +1,141 @@
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """Все варианты word без не более чем max_distance символов (включая само слово)"""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        result |= frontier
+    return result
+
+
+def _within_one(a: str, b: str) -> bool:
+    """Быстрая проверка расстояния не больше 1 (замена, вставка, удаление, перестановка)"""
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return False
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) != len(b):
+        return a[i + 1:] == b[i:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1])
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау–Левенштейна (перестановка соседних символов — одна правка).
+
+    Если расстояние больше limit, возвращает limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class CodeSuggester:
+    """Поиск похожих кодов фильмов по схеме SymSpell.
+
+    Для каждого кода заранее сохраняются все его варианты с удалёнными
+    max_distance символами. Запрос порождает такие же варианты, и любой код
+    на расстоянии не больше max_distance обязательно делит с ним хотя бы
+    один вариант, так что поиск сводится к нескольким обращениям к словарю
+    и проверке немногих кандидатов.
+    """
+
+    def __init__(self, max_distance: int = 1):
+        self.max_distance = max_distance
+        # Вариант → коды; кортежи заметно компактнее множеств, а списки кодов у варианта короткие
+        self._index: Dict[str, Tuple[str, ...]] = {}
+        self._codes: Set[str] = set()
+        # Длина кода → сколько таких кодов: по ней отсекаются запросы длиннее любого кода
+        self._lengths = Counter()
+
+    @property
+    def max_length(self) -> int:
+        return max(self._lengths, default=0)
+
+    def build(self, codes: Iterable[str]):
+        self._index.clear()
+        self._codes.clear()
+        self._lengths.clear()
+        for code in codes:
+            self.add(code)
+
+    def add(self, code: str):
+        if code in self._codes:
+            return
+        self._codes.add(code)
+        self._lengths[len(code)] += 1
+        for variant in _deletes(code, self.max_distance):
+            self._index[variant] = self._index.get(variant, ()) + (code,)
+
+    def remove(self, code: str):
+        if code not in self._codes:
+            return
+        self._codes.discard(code)
+        self._lengths[len(code)] -= 1
+        if not self._lengths[len(code)]:
+            del self._lengths[len(code)]
+        for variant in _deletes(code, self.max_distance):
+            codes = tuple(other for other in self._index.get(variant, ()) if other != code)
+            if codes:
+                self._index[variant] = codes
+            else:
+                self._index.pop(variant, None)
+
+    def suggest(self, text: str, limit: int = 3) -> List[str]:
+        """Ближайшие к text коды (кроме него самого): по расстоянию, разнице длины и коду"""
+        # Вариантов удаления O(len(text) ** max_distance), а код длиннее любого известного
+        # больше чем на max_distance ни на что не похож — не тратим на него event loop
+        if len(text) > self.max_length + self.max_distance:
+            return []
+        candidates = set()
+        for variant in _deletes(text, self.max_distance):
+            candidates.update(self._index.get(variant, ()))
+        candidates.discard(text)
+        scored = []
+        for code in candidates:
+            if self.max_distance == 1:
+                distance = 1 if _within_one(text, code) else 2
+            else:
+                distance = edit_distance(text, code, self.max_distance)
+            if distance <= self.max_distance:
+                # Опечатки чаще меняют символы, чем добавляют или теряют их
+                scored.append((distance, abs(len(code) - len(text)), code))
+        scored.sort()
+        return [code for _, _, code in scored[:limit]]
+
+    def __len__(self):
+        return len(self._codes)
+
+    def memory_usage(self) -> int:
+        """Примерный объём индекса в байтах"""
+        total = sys.getsizeof(self._index) + sys.getsizeof(self._codes)
+        for variant, codes in self._index.items():
+            total += sys.getsizeof(variant) + sys.getsizeof(codes)
+        return total + sum(sys.getsizeof(code) for code in self._codes)
+
+    def stats(self) -> dict:
+        return {
+            'codes': len(self),
+            'variants': len(self._index),
+            'max_distance': self.max_distance,
+            'memory_bytes': self.memory_usage(),
+        }
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.py при импорте открывает базу DATABASE_PATH — рабочая movies.db в тестах не нужна
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="film-bot-tests-"), "movies.db"))
@@ -0,0 +1,110 @@
+"""Сканер архив-канала и импорт каталога на фейковом Bot API и временной базе"""
+import asyncio
+import io
+
+import pytest
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+
+from archive_scanner import ArchiveScanner
+from bot import Database
+from fake_bot_api import FakeBotAPI
+from movies_tool import Importer, connect, read_rows
+
+ARCHIVE_ID = -1001
+SCRATCH_ID = 42
+
+
+def video(code, file_id):
+    return {'video': {'file_id': file_id, 'file_unique_id': f"u{file_id}", 'width': 0, 'height': 0, 'duration': 0},
+            'caption': f"Фильм #{code}"}
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "movies.db"), readers=1)
+    yield database
+    database.close()
+
+
+def run_scan(api, scanner, scratch_chat_id=SCRATCH_ID):
+    async def scan():
+        await api.start()
+        try:
+            async with Bot(api.token, base_url=api.base_url) as bot:
+                return await scanner.scan(bot, scratch_chat_id)
+        finally:
+            await api.stop()
+    return asyncio.run(scan())
+
+
+def test_scan_imports_archive_and_resumes(db):
+    api = FakeBotAPI(history={ARCHIVE_ID: [
+        dict(video(1, "f1"), message_id=1),
+        dict(video(2, "f2"), message_id=2),
+        {'message_id': 3, 'text': 'объявление'},
+        # 4 и 5 удалены
+        dict(video(3, "f3"), message_id=6),
+    ]})
+    scanner = ArchiveScanner(db, ARCHIVE_ID, batch_size=2, max_gap=3, rate=1000)
+
+    report = run_scan(api, scanner)
+    assert (report['start_message_id'], report['last_message_id']) == (0, 6)
+    assert (report['scanned'], report['imported'], report['new'], report['skipped']) == (4, 3, 3, 1)
+    assert asyncio.run(db.get_movie("3"))[1] == "f3"
+    # Пересланные копии удалены из служебного чата
+    assert not api.chats.get(SCRATCH_ID)
+
+    # Следующий запуск начинает с сохранённой позиции и берёт только новые сообщения
+    api._store(ARCHIVE_ID, dict(video(4, "f4"), message_id=7))
+    api._store(ARCHIVE_ID, dict(video(1, "f1"), message_id=8))
+    report = run_scan(api, scanner)
+    assert (report['start_message_id'], report['last_message_id']) == (6, 8)
+    assert (report['scanned'], report['imported'], report['new']) == (2, 2, 1)
+    assert asyncio.run(db.get_archive_scan_position(ARCHIVE_ID)) == 8
+
+    report = run_scan(api, scanner)
+    assert (report['start_message_id'], report['scanned']) == (8, 0)
+
+
+def test_scan_aborts_on_bad_request_that_is_not_a_gap(db):
+    api = FakeBotAPI(history={ARCHIVE_ID: [dict(video(1, "f1"), message_id=1)]})
+    api.missing_chats.add(SCRATCH_ID)
+    scanner = ArchiveScanner(db, ARCHIVE_ID, max_gap=3, rate=1000)
+
+    with pytest.raises(BadRequest, match="not found"):
+        run_scan(api, scanner)
+    assert asyncio.run(db.get_archive_scan_position(ARCHIVE_ID)) == 0
+    assert api.calls['forwardMessage'] == 1
+
+
+def test_scan_gives_up_when_telegram_keeps_refusing(db):
+    # Без планировщика RetryAfter не повторяется: скан падает и освобождает блокировку
+    api = FakeBotAPI(history={ARCHIVE_ID: [dict(video(i, f"f{i}"), message_id=i) for i in range(1, 4)]},
+                     flood_rate=0.01)
+    scanner = ArchiveScanner(db, ARCHIVE_ID, max_gap=3, rate=1000)
+
+    with pytest.raises(RetryAfter):
+        run_scan(api, scanner)
+    assert not scanner.running
+    assert api.calls['forwardMessage'] == 2
+
+
+def test_import_counts_malformed_jsonl_lines(db):
+    lines = [
+        '{"code": "10", "file_id": "f10", "caption": "#10"}',
+        '{"code": "11", "file_id": ',
+        '[1, 2]',
+        '',
+        '{"code": "bad code", "file_id": "f12"}',
+        '{"code": "#13", "file_id": "f13"}',
+    ]
+    conn = connect(db.db_path)
+    try:
+        report = Importer(conn).run(read_rows(io.StringIO("\n".join(lines) + "\n"), 'jsonl'))
+        codes = [row[0] for row in conn.execute('SELECT code FROM movies ORDER BY code')]
+    finally:
+        conn.close()
+
+    assert (report['read'], report['inserted'], report['invalid']) == (5, 2, 3)
+    assert codes == ["10", "13"]
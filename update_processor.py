@@ -0,0 +1,93 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка для каждого пользователя.
+
+    Апдейты разных пользователей обрабатываются одновременно (не больше
+    max_concurrent_updates), апдейты одного пользователя — строго по очереди,
+    чтобы код и нажатие «Tekshirish» не обгоняли друг друга.
+
+    on_arrival вызывается синхронно в момент получения апдейта, до ожидания
+    очереди пользователя (например, чтобы считать частоту его апдейтов).
+    """
+
+    # Общий семафор BaseUpdateProcessor занимается до do_process_update, и апдейт, ждущий
+    # своей очереди у пользователя, держал бы слот впустую. Поэтому базовому классу отдаём
+    # заведомо большой лимит, а свой семафор берём уже после очереди пользователя
+    BASE_LIMIT = 2 ** 31 - 1
+
+    def __init__(self, max_concurrent_updates: int, on_arrival: Optional[Callable[[object], None]] = None):
+        super().__init__(self.BASE_LIMIT)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self.on_arrival = on_arrival
+        # Для каждого пользователя — событие завершения его последнего апдейта в очереди
+        self._tails: Dict[Hashable, asyncio.Event] = {}
+        self.active = 0
+        self.waiting = 0
+        self.processed = 0
+        self.peak_active = 0
+
+    @staticmethod
+    def _key(update: object) -> Optional[Hashable]:
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        # Семафор базового класса с таким лимитом не ждёт, так что сюда апдейты попадают
+        # в порядке получения. Место в очереди занимается до первого await
+        if self.on_arrival is not None:
+            self.on_arrival(update)
+        key = self._key(update)
+        previous = done = None
+        if key is not None:
+            previous = self._tails.get(key)
+            done = self._tails[key] = asyncio.Event()
+        self.waiting += 1
+        started = False
+        try:
+            if previous is not None:
+                await previous.wait()
+            async with self._slots:
+                self.waiting -= 1
+                started = True
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+                try:
+                    await coroutine
+                finally:
+                    self.active -= 1
+                    self.processed += 1
+        finally:
+            if not started:
+                self.waiting -= 1
+                coroutine.close()
+            if done is not None:
+                done.set()
+                if self._tails.get(key) is done:
+                    del self._tails[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            'max_concurrent': self.limit,
+            'active': self.active,
+            'peak_active': self.peak_active,
+            'waiting': self.waiting,
+            'users_queued': len(self._tails),
+            'processed': self.processed,
+        }
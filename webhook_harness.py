@@ -0,0 +1,123 @@
+"""Замер задержки webhook-режима без Telegram.
+
+Поднимает фейковый Bot API и webhook-сервер бота с теми же обработчиками,
+что в main(), POST-ит синтетические апдейты с кодом фильма от разных
+пользователей и меряет время от отправки апдейта до первого ответа бота
+(sendVideo/sendMessage в чат пользователя). База — временный файл.
+
+    python webhook_harness.py --updates 1000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "harness.db"))
+# Меряем сам бот, а не лимит Telegram на отправку (OUTBOUND_GLOBAL_RATE=30 ограничил бы замер)
+os.environ.setdefault("OUTBOUND_GLOBAL_RATE", "100000")
+
+import httpx
+
+from fake_bot_api import FakeBotAPI
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+REPLY_METHODS = ('sendVideo', 'sendMessage')
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+        },
+    }
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def main(args):
+    import bot
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    api = FakeBotAPI()
+    replies = {}
+
+    # Ловим первый ответ бота в каждый чат
+    for method in REPLY_METHODS:
+        handler = api.methods[method]
+
+        async def record(params, handler=handler):
+            future = replies.get(int(params['chat_id']))
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+            return await handler(params)
+
+        api.methods[method] = record
+
+    await api.start()
+    await bot.db.add_movies([(args.code, "harness_file_id", f"#{args.code} harness")])
+
+    application = bot.build_application(api.token, api.base_url)
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_webhook(
+        listen="127.0.0.1", port=args.port, url_path="telegram",
+        webhook_url=f"http://127.0.0.1:{args.port}/telegram", secret_token=args.secret,
+    )
+    await application.start()
+    url = f"http://127.0.0.1:{args.port}/telegram"
+
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            response = await client.post(url, json=make_update(0, 1, args.code), headers={SECRET_HEADER: "wrong"})
+            print(f"🔐 Апдейт с неверным секретом: HTTP {response.status_code}")
+
+            async def send(i: int):
+                user_id = 1_000_000 + i
+                async with semaphore:
+                    reply = replies[user_id] = asyncio.get_running_loop().create_future()
+                    started_at = time.perf_counter()
+                    await client.post(url, json=make_update(i + 1, user_id, args.code),
+                                      headers={SECRET_HEADER: args.secret})
+                    latencies.append(await asyncio.wait_for(reply, args.timeout) - started_at)
+                    del replies[user_id]
+
+            started_at = time.perf_counter()
+            await asyncio.gather(*(send(i) for i in range(args.updates)))
+            elapsed = time.perf_counter() - started_at
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+        await api.stop()
+
+    ms = [latency * 1000 for latency in latencies]
+    print(
+        f"📨 Апдейтов: {len(ms)} за {elapsed:.2f} сек ({len(ms) / elapsed:.0f}/сек)\n"
+        f"⏱ Задержка до ответа, мс: p50 {percentile(ms, 0.5):.1f}, p95 {percentile(ms, 0.95):.1f}, "
+        f"p99 {percentile(ms, 0.99):.1f}, среднее {statistics.mean(ms):.1f}\n"
+        f"📡 Вызовов Bot API: {dict(api.calls)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замер задержки webhook-режима на фейковом Bot API")
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8444)
+    parser.add_argument("--code", default="101")
+    parser.add_argument("--secret", default="harness-secret")
+    parser.add_argument("--timeout", type=float, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def utc_timestamp() -> str:
+    """Текущее время в формате CURRENT_TIMESTAMP из SQLite"""
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class PeriodicFlusher:
+    """Основа для буферов с отложенной записью: таймер и сброс при остановке"""
+
+    def __init__(self, flush_interval: float = 5):
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def flush(self):
+        raise NotImplementedError
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # stop() отменяет таймер, но не начатый сброс: данные уже вынуты из буфера.
+            # Сброс из stop() дождётся его на блокировке
+            await asyncio.shield(self.flush())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает таймер и сбрасывает всё, что осталось в буфере"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+class UserWriteBehind(PeriodicFlusher):
+    """Отложенная пакетная запись в таблицу users.
+
+    Новые пользователи и отметки активности копятся в памяти (по одной
+    записи на пользователя) и сбрасываются одной транзакцией через
+    executemany — по таймеру или при переполнении буфера.
+    """
+
+    def __init__(self, pool, flush_interval: float = 5, max_pending: int = 1000):
+        super().__init__(flush_interval)
+        self.pool = pool
+        self.max_pending = max_pending
+        self._new_users: Dict[int, tuple] = {}
+        self._activity: Dict[int, str] = {}
+        self._lock = asyncio.Lock()
+        self._flush_scheduled = False
+        self.flushes = 0
+        self.rows_written = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._new_users) + len(self._activity)
+
+    def add_user(self, user_id: int, username: Optional[str] = None):
+        if user_id not in self._new_users:
+            self._new_users[user_id] = (username, utc_timestamp())
+        self._maybe_flush()
+
+    def touch(self, user_id: int):
+        self._activity[user_id] = utc_timestamp()
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.pending >= self.max_pending and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def _write(self, conn, new_users, activity):
+        conn.executemany(
+            'INSERT OR IGNORE INTO users (user_id, username, joined_at, last_activity) VALUES (?, ?, ?, ?)',
+            [(user_id, username, ts, ts) for user_id, (username, ts) in new_users.items()]
+        )
+        # Пользователь снова пишет боту — значит, он снова достижим для рассылок
+        conn.executemany(
+            'UPDATE users SET last_activity = ?, unreachable_reason = NULL, unreachable_at = NULL WHERE user_id = ?',
+            [(ts, user_id) for user_id, ts in activity.items()]
+        )
+
+    async def flush(self):
+        async with self._lock:
+            self._flush_scheduled = False
+            if not self.pending:
+                return
+            new_users, self._new_users = self._new_users, {}
+            activity, self._activity = self._activity, {}
+            try:
+                # Отмена flush не должна отменять саму запись
+                await asyncio.shield(self.pool.write(self._write, new_users, activity))
+            except Exception as e:
+                logger.error(f"Ошибка записи активности пользователей: {e}")
+                # Возвращаем данные в буфер, более свежие значения не затираем
+                for user_id, value in new_users.items():
+                    self._new_users.setdefault(user_id, value)
+                for user_id, ts in activity.items():
+                    self._activity.setdefault(user_id, ts)
+                return
+            self.flushes += 1
+            self.rows_written += len(new_users) + len(activity)